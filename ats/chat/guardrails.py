@@ -1,29 +1,46 @@
 import json
-import re
+from collections import Counter
+from typing import Optional
 
 from langchain_core.messages import HumanMessage
 
+from ats.chat.keyword_matcher import KeywordMatcher
 from ats.chat.prompts import guardrail_prompt
+from ats.chat.topic_classifier import TopicClassifier
 from ats.logger import get_logger
+from ats.tracing import current_span, llm_config, traced
 from ats.chat.utils import words_for_guardrails
 from ats.chat.utils import convert_langchain_messages_to_openai
 
 logger = get_logger("guardrails")
 
+# built once at import, not on every Guardrails construction
+_GUARDRAILS_MATCHER = KeywordMatcher(words_for_guardrails)
+
+
 # who need a library when you can reinvent it
 # but actually it was unnecessary to add another library with it's own flow for llms
 # this class can be easily modified in any way after poc stage
 class Guardrails:
     """...kind of"""
 
-    def __init__(self, fallback_to_llm: bool = False, llm=None):
-        escaped_words = "|".join(re.escape(word) for word in words_for_guardrails)
-        self.regexp = re.compile(
-            r"(?:^|(?<=\W))(" + escaped_words + r")(?=\W|$)", re.IGNORECASE | re.UNICODE
-        )
+    def __init__(
+        self,
+        fallback_to_llm: bool = False,
+        llm=None,
+        classifier: Optional[TopicClassifier] = None,
+        classifier_threshold: float = 0.8,
+    ):
+        self.matcher = _GUARDRAILS_MATCHER
         self.fallback_to_llm = fallback_to_llm
         self.llm = llm
         self.llm_prompt = guardrail_prompt
+        # local tier between keywords and llm, decides only if it's confident:
+        # p >= threshold passes, p <= 1 - threshold is rejected, everything in between goes to llm
+        self.classifier = classifier
+        self.classifier_threshold = classifier_threshold
+        # which check made the decision, to see how often llm is called
+        self.stats = Counter()
 
     def _filter_messages(self, messages: list[dict]) -> list[dict]:
         return [x for x in messages if x["role"] in ["assistant", "user"]]
@@ -33,28 +50,60 @@ class Guardrails:
         messages = self._filter_messages(messages)
         return messages
 
+    @traced("guardrails")
     def rail(self, messages) -> bool:
         messages = self._prepare_messages(messages)
-        flag = self.check_messages_regexp(messages)
-        logger.debug("Regexp guardrail check: {}".format(flag))
-        if not flag and self.fallback_to_llm:
+        flag = self.check_messages_keywords(messages)
+        logger.debug("Keywords guardrail check: {}".format(flag))
+        if flag:
+            return self._decided("keywords", flag)
+        if self.classifier is not None:
+            flag = self.check_messages_classifier(messages)
+            logger.debug("Classifier guardrail check: {}".format(flag))
+            if flag is not None:
+                return self._decided("classifier", flag)
+        if self.fallback_to_llm:
             flag = self.check_messages_llm(messages)
             logger.debug("LLM guardrail check: {}".format(flag))
+            return self._decided("llm", flag)
+        return self._decided("rejected", False)
+
+    def _decided(self, check: str, flag: bool) -> bool:
+        self.stats[check] += 1
+        current_span().set(decided_by=check, passed=flag)
         return flag
 
     # stupid and simple, to reduce number of queries that go to LLM and hence reduce latency and price
-    # it would be nice to replace it with BERT-ish model, but it's out of scope for now
-    # stemming / lemmatization would be nice too, but I don't have time for this
-    def check_messages_regexp(self, messages: list[dict]) -> bool:
+    # messages without keywords go to the local classifier, see `check_messages_classifier`
+    def check_messages_keywords(self, messages: list[dict]) -> bool:
         messages = " ".join([x["content"] for x in messages[-1:] if x["role"] == "user"])  # is 1 msg too strict?
-        logger.debug("regexp check messages: {}".format(messages))
-        if self.regexp.search(messages) is not None:
-            return True
-        else:
+        logger.debug("keywords check messages: {}".format(messages))
+        return self.matcher.search(messages)
+
+    def check_messages_classifier(self, messages: list[dict]) -> Optional[bool]:
+        """Check the latest user message with the local classifier, None if it's not confident.
+
+        Classifier sees only this message, and follow-ups like "sort them by price" look the same
+        whatever they refer to, so it passes a message only if the previous user turn was on-topic too,
+        otherwise the llm decides with the conversation. Confident rejections don't need the context.
+        """
+        if not messages or messages[-1]["role"] != "user":
+            return None
+        user_messages = [x["content"] for x in messages if x["role"] == "user"]
+        proba = self.classifier.predict_proba(user_messages[-1])
+        logger.debug("classifier on-topic probability: {:.3f}".format(proba))
+        if proba <= 1 - self.classifier_threshold:
             return False
+        if proba >= self.classifier_threshold and len(user_messages) > 1 and self._on_topic(user_messages[-2]):
+            return True
+        return None
+
+    def _on_topic(self, message: str) -> bool:
+        # previous user turn, the same tiers that would have passed it without llm
+        return self.matcher.search(message) or self.classifier.predict_proba(message) >= self.classifier_threshold
 
     def check_messages_llm(self, messages: list[dict]) -> bool:
         messages = json.dumps(messages[-5:], ensure_ascii=False)
         logger.debug("llm check messages: {}".format(messages))
-        res = self.llm.invoke([HumanMessage(self.llm_prompt + messages)])
+        res = self.llm.invoke([HumanMessage(self.llm_prompt + messages)], config=llm_config())
         return res["flag"]
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+from ats.chat.prompts import history_summary_prompt
+from ats.logger import get_logger
+from ats.tokens import count_tokens
+
+logger = get_logger(name="history")
+
+
+def split_turns(messages: list[BaseMessage]) -> list[list[BaseMessage]]:
+    """Split conversation into turns, every turn starts with a user message.
+
+    Tool calls and their results are always in the same turn, so dropping whole turns
+    never leaves a tool message without its call.
+    """
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _result_columns(payload, fmt: str) -> Optional[list]:
+    # see `ats.db_agent.encoding`, columns are taken without decoding the whole table
+    if fmt == "columns" and isinstance(payload, dict):
+        return payload.get("columns")
+    if fmt == "csv" and isinstance(payload, str):
+        return payload.split("\n", 1)[0].split(",")
+    if isinstance(payload, list) and payload and isinstance(payload[0], dict):
+        return list(payload[0])
+    return None
+
+
+def _result_rows(payload, fmt: str) -> Optional[int]:
+    if fmt == "columns" and isinstance(payload, dict):
+        return len(payload.get("data", []))
+    if fmt == "csv" and isinstance(payload, str):
+        return max(0, len(payload.strip().splitlines()) - 1)
+    if isinstance(payload, list):
+        return len(payload)
+    return None
+
+
+def stub_tool_message(message: ToolMessage) -> ToolMessage:
+    """Replace result table of a db_tool message with a short description of it.
+
+    Full result stays in the result store (if it's used), so the model can refer to it by id
+    or ask the database again.
+    """
+    try:
+        tool_result = json.loads(message.content)
+    except (TypeError, ValueError):
+        return message  # e.g. "Tool failed: ...", already short
+    if not isinstance(tool_result, dict) or tool_result.get("error") or "result" not in tool_result:
+        return message
+    payload, fmt = tool_result["result"], tool_result.get("format", "records")
+    if isinstance(payload, str) and fmt != "csv":  # older tool messages had json string inside json
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            pass
+    stub = {
+        "user_query": tool_result.get("user_query"),
+        "result_id": tool_result.get("result_id"),
+        "row_count": tool_result.get("row_count", _result_rows(payload, fmt)),
+        "columns": _result_columns(payload, fmt),
+        "result": "Omitted from history, query the database again if rows are needed.",
+    }
+    return ToolMessage(
+        content=json.dumps({k: v for k, v in stub.items() if v is not None}, ensure_ascii=False),
+        tool_call_id=message.tool_call_id,
+        name=message.name,
+        id=message.id,
+    )
+
+
+def _text(message: BaseMessage) -> str:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        content += json.dumps([call["args"] for call in tool_calls], ensure_ascii=False)
+    return content
+
+
+class HistoryManager:
+    """Bounds the conversation history that is sent to the chat agent.
+
+    - last `keep_turns` turns are sent as is
+    - older turns are sent with db_tool results replaced by stubs (query, row count, columns, result id)
+    - with `summary_llm`, turns older than that are summarized in blocks of `summary_every` turns,
+      summary of a block is cached, so the summarization call happens once per block, not on every message
+    - if history is still larger than `max_tokens`, the oldest stubbed turns are dropped
+
+    Full history is kept in the UI, this only changes what goes to the model.
+    """
+
+    def __init__(
+        self,
+        keep_turns: int = 3,
+        max_tokens: Optional[int] = None,
+        summary_llm=None,
+        summary_every: int = 5,
+        model_name: str = "gpt-4o",
+        cache_size: int = 256,
+    ):
+        """
+        Args:
+            keep_turns: number of latest turns sent without changes
+            max_tokens: token budget of the history, None means no limit
+            summary_llm: chat model to summarize old turns, they are kept as stubs if not set
+            summary_every: number of turns that are summarized at once
+            model_name: model name for token counting
+            cache_size: number of cached summaries
+        """
+        self.keep_turns = keep_turns
+        self.max_tokens = max_tokens
+        self.summary_llm = summary_llm
+        self.summary_every = summary_every
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self._summaries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def window(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """Messages to send to the chat agent instead of the full history."""
+        turns = split_turns(messages)
+        if len(turns) <= self.keep_turns and self.max_tokens is None:
+            return list(messages)
+        split = max(0, len(turns) - self.keep_turns)
+        older, recent = turns[:split], turns[split:]
+
+        summary = None
+        if self.summary_llm is not None and older:
+            n_summarized = len(older) // self.summary_every * self.summary_every
+            if n_summarized:
+                summary = self._summarize(older[:n_summarized])
+                older = older[n_summarized:]
+
+        older = [[stub_tool_message(m) if isinstance(m, ToolMessage) else m for m in turn] for turn in older]
+
+        if self.max_tokens is not None:
+            budget = self.max_tokens - sum(count_tokens(_text(m), self.model_name) for t in recent for m in t)
+            if summary is not None:
+                budget -= count_tokens(summary, self.model_name)
+            sizes = [sum(count_tokens(_text(m), self.model_name) for m in turn) for turn in older]
+            while older and sum(sizes) > budget:
+                older.pop(0)
+                sizes.pop(0)
+
+        result = [SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")] if summary else []
+        result += [m for turn in older + recent for m in turn]
+        logger.debug(f"History windowed from {len(messages)} to {len(result)} messages")
+        return result
+
+    def _summarize(self, turns: list[list[BaseMessage]]) -> str:
+        # block by block, so summary of first blocks is reused when the next block is added
+        summary = ""
+        for i in range(0, len(turns), self.summary_every):
+            block = [
+                stub_tool_message(m) if isinstance(m, ToolMessage) else m
+                for turn in turns[i : i + self.summary_every]
+                for m in turn
+            ]
+            conversation = json.dumps(
+                [{"role": m.type, "content": _text(m)} for m in block], ensure_ascii=False
+            )
+            key = hashlib.sha256((summary + conversation).encode()).hexdigest()
+            with self._lock:
+                cached = self._summaries.get(key)
+                if cached is not None:
+                    self._summaries.move_to_end(key)
+            if cached is None:
+                logger.info(f"Summarizing {len(block)} history messages")
+                response = self.summary_llm.invoke(
+                    [HumanMessage(history_summary_prompt.format(summary=summary or "-", conversation=conversation))]
+                )
+                cached = response.content
+                with self._lock:
+                    self._summaries[key] = cached
+                    while len(self._summaries) > self.cache_size:
+                        self._summaries.popitem(last=False)
+            summary = cached
+        return summary
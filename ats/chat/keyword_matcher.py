@@ -0,0 +1,78 @@
+import re
+import unicodedata
+
+# words, "+" or "-" right after a word is a part of it, so "A+" and "AB-" are single tokens
+# and "a + b" is not, a hyphen between words ("blood-test") is dropped
+_TOKEN_RE = re.compile(r"\w+(?:[+-](?!\w))?")
+# trie key of a node where a keyword ends, tokens are never empty
+_END = ""
+
+
+def stem(token: str) -> str:
+    """Strip plural suffixes only, so "patients"/"therapies"/"classes" match "patient"/"therapy"/"class".
+
+    Verb forms are not touched on purpose: with -ed/-ing stripping "united" became "unit"
+    and "trending" became "trend", and a keyword hit skips the classifier and the llm.
+    Short tokens like "has" or "its" are kept as is.
+    """
+    if len(token) <= 3 or not token.isalpha():
+        return token
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """Casefolded tokens with plurals stemmed.
+
+    Hyphens inside words are dropped, so "blood-test" and "blood test" are the same tokens,
+    while "A-" and "A+" keep their symbol, and a standalone "+" or "-" is not a token at all.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return [stem(token) for token in _TOKEN_RE.findall(text)]
+
+
+class KeywordMatcher:
+    """Finds keywords in a message by tokens instead of a big alternation regex.
+
+    Single token keywords (including "A+", "AB-") are a set lookup per token,
+    keywords of several tokens ("blood-test", "length-of-stay") are matched with a token trie.
+    Keywords and messages go through the same `tokenize`, so matching is case-insensitive
+    and plurals ("patients", "therapies") match without listing them.
+    """
+
+    def __init__(self, keywords: list[str]):
+        self.words: set[str] = set()
+        self.trie: dict = {}
+        for keyword in keywords:
+            tokens = tokenize(keyword)
+            if not tokens:
+                continue
+            if len(tokens) == 1:
+                self.words.add(tokens[0])
+                continue
+            node = self.trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[_END] = keyword
+
+    def search(self, text: str) -> bool:
+        """True if any keyword is in the text."""
+        tokens = tokenize(text)
+        for i, token in enumerate(tokens):
+            if token in self.words:
+                return True
+            node = self.trie.get(token)
+            j = i + 1
+            while node is not None:
+                if _END in node:
+                    return True
+                if j == len(tokens):
+                    break
+                node = node.get(tokens[j])
+                j += 1
+        return False
@@ -52,3 +52,14 @@ Response in json:
 
 Conversation:
 """
+
+history_summary_prompt = """Summarize this part of a conversation between a doctor and a healthcare database assistant.
+Keep what is needed to answer follow-up questions: what was asked, filters used (names, dates, conditions, hospitals),
+key numbers from the answers and result ids of database results. Be brief, no more than 10 lines.
+
+Summary of the conversation before this part:
+{summary}
+
+Conversation:
+{conversation}
+"""
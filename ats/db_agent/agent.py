@@ -1,35 +1,122 @@
+import asyncio
+import contextvars
+import functools
 import json
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Generator, Optional, Union
 
 import pandas as pd
-from langchain.schema import HumanMessage
+from langchain.schema import HumanMessage, SystemMessage
 from retry import retry
 
 from ats.db_agent.prompts import (
-    data_context,
     nlq_check_prompt,
     nlq_to_sql_prompt,
     prompt_simple_check_sql,
-    sql_context,
-    prompt_regenerate_sql
+    sql_contexts,
+    prompt_regenerate_sql,
+    prompt_repair_sql,
+    prompt_resolved_entities,
+    render_data_context,
+    system_prompt,
 )
+from ats.db_agent.cache import QueryCache
+from ats.db_agent.encoding import encode_result
+from ats.db_agent.entity_resolution import EntityResolver
+from ats.db_agent.sql_validator import SQLValidator
 from ats.logger import get_logger
+from ats.result_store import ResultStore
+from ats.tokens import count_tokens
+from ats.tracing import current_span, llm_config, traced
 
 logger = get_logger(name="db_agent")
 
+# generator of pipeline steps, see `DBAgent._run_steps`
+_Steps = Generator[tuple, Any, Any]
+
+
+def aretry(tries: int = 2):
+    """Async counterpart of `retry(tries=...)`, which doesn't work with coroutines."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            for attempt in range(1, tries + 1):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    if attempt == tries:
+                        raise
+                    logger.warning(f"{func.__name__} failed: {e}, retrying")
+
+        return wrapper
+
+    return decorator
+
 
 class DBAgent:
-    def __init__(self, model, db, double_check=False, table_truncation=200):
+    def __init__(
+        self,
+        model,
+        db,
+        double_check=False,
+        table_truncation=200,
+        cache: Optional[QueryCache] = None,
+        model_name: Optional[str] = None,
+        parallel: bool = False,
+        sql_validation: bool = True,
+        sql_fix_attempts: int = 2,
+        sql_repair_attempts: int = 1,
+        result_store: Optional[ResultStore] = None,
+        result_format: str = "columns",
+        entity_resolver: Optional[EntityResolver] = None,
+        compact_schema: bool = False,
+    ):
         self.model = model
         self.db = db
-        self.temp_table = None
         self.double_check = double_check
         self.truncation_limit = table_truncation
-        
-        logger.info(f"DBAgent initialized with double_check={double_check}, truncation_limit={table_truncation}")
+        self.cache = cache
+        # part of the cache key, structured output runnable doesn't know its model name
+        self.model_name = model_name or getattr(model, "model_name", type(model).__name__)
+        # run nlq check and sql generation concurrently
+        self.parallel = parallel
+        # cheap local check of generated sql before execution and llm review
+        self.validator = SQLValidator.from_database(db) if sql_validation else None
+        self.sql_fix_attempts = sql_fix_attempts
+        # regenerations with database error if query fails during execution
+        self.sql_repair_attempts = sql_repair_attempts
+        # full results are stored here, only first `table_truncation` rows are returned to the model
+        self.result_store = result_store
+        # encoding of result tables in tool messages, see `ats.db_agent.encoding`
+        self.result_format = result_format
+        # grounds names from the user query in actual table values before sql generation
+        self.entity_resolver = entity_resolver
+
+        # sql flavour and index hints depend on the database engine, available tables on materialization
+        dialect = getattr(db, "dialect", "sqlite")
+        self.sql_context = sql_contexts[dialect]
+        self.data_context = render_data_context(
+            compact=compact_schema,
+            summary_tables=bool(getattr(db, "summary_tables", None)),
+            indexes=getattr(db, "indexed", False),
+        )
+        # the same system message for every call, so it's cached on the provider side
+        self.system_prompt = system_prompt(self.data_context, self.sql_context)
+        self.prompt_tokens = {
+            "system": count_tokens(self.system_prompt, self.model_name),
+            "nlq_check": count_tokens(nlq_check_prompt, self.model_name),
+            "nlq_to_sql": count_tokens(nlq_to_sql_prompt, self.model_name),
+            "simple_check_sql": count_tokens(prompt_simple_check_sql, self.model_name),
+        }
+        logger.info(f"Static prompt tokens: {self.prompt_tokens}")
+
+        logger.info(
+            f"DBAgent initialized with double_check={double_check}, truncation_limit={table_truncation}, parallel={parallel}"
+        )
         logger.debug(f"Model type: {type(model).__name__}, DB type: {type(db).__name__}")
 
-    @retry(tries=2)
+    @traced("db_tool")
     def tool(self, user_query: str) -> dict[str, Union[str, list[dict]]]:
         """
         Executes user's natural language query on healthcare database.
@@ -41,9 +128,10 @@ class DBAgent:
                 - if it a read-only request
                 - if it aligns with the database/table description
             - Return an error with a message if the query is not valid
-        - Generate SQL query
+        - Generate SQL query, with names from the query resolved to exact table values if `entity_resolver` is set
+        - Validate it locally against the table schema, regenerate with the error if needed
         - Optionally double check the query
-        - Execute the SQL query against the database
+        - Execute the SQL query against the database, regenerate it once with the database error if it fails
         - Return the result of the SQL query execution
 
         Args:
@@ -51,72 +139,328 @@ class DBAgent:
         """
         meta = {"user_query": user_query}
         logger.info(f"Processing user query: '{user_query}'")
+
+        cache_key, cached = self._cache_lookup(user_query)
+        if cached is not None:
+            result = cached.get("result")
+            if result is None:
+                result = self.execute_sql_query(cached["sql"])
+            if not isinstance(result, str):
+                return self._format_result(result, cached["sql"], meta)
+            logger.warning("Cached SQL query failed, running full pipeline")
         
+        # names are resolved once on the original question, regenerations and repairs reuse them
+        entities = self._resolved_entities(user_query)
         # to prevent hallucinations when LLM is confidently trying to query data that doesn't exist
-        logger.debug("Starting query validation")
-        check_valid, message = self.check_nlq(user_query)
+        check_valid, message, sql_query = self.check_and_generate(user_query, entities)
         
         if not check_valid:
             logger.warning(f"Query validation failed for: '{user_query}' - Reason: {message}")
-            return {"error": message, "result": "[]"}
+            return self._error(message)
         
-        logger.info("Query validation passed")
-
-        logger.info("Starting SQL query generation")
-        sql_query = self.generate_sql_query(user_query)
         logger.info(f"Generated SQL query: {sql_query}")
 
+        sql_query = self.validate_sql(user_query, sql_query, entities)
+        if sql_query is None:
+            return self._error("Can't create correct sql query")
+
         # It's dumb AF sometimes, for this reason it's behind a switch
         # "It filters patients based on the doctor's name, which is incorrect.
         # The query should filter based on the doctor's name to get patients associated with that doctor." © gpt-4.1
-        # 
-        # this should be a separate function
         if self.double_check:
-            logger.info("Double-check enabled, validating generated SQL")
-            for i in range(3):  # TODO: move to params
-                logger.debug(f"SQL validation attempt #{i + 1}")
-                sql_check = self.simple_check_sql(user_query, sql_query)
-                logger.debug(f"SQL validation results: {json.dumps(sql_check, indent=2)}")
-                
-                if sql_check["is_correct"]:
-                    logger.info(f"SQL validation passed on attempt #{i + 1}")
-                    break
-                    
-                logger.warning(f"SQL validation failed on attempt #{i + 1}, regenerating query")
-                prompt = prompt_regenerate_sql.format(user_query=user_query, sql_query=sql_query, review=sql_check)
-                sql_query = self.generate_sql_query(prompt)
-                logger.info(f"Regenerated SQL query: {sql_query}")
-            else:
-                logger.warning("Maximum SQL validation attempts reached, performing final check")
-                sql_check = self.simple_check_sql(user_query, sql_query)
-                logger.debug(f"Final SQL validation results: {json.dumps(sql_check, indent=2)}")
-                if not sql_check["is_correct"]:
-                    logger.error("Failed to generate correct SQL query after all attempts")
-                    return {"error": "Can't create correct sql query", "result": "[]"}
-            
+            sql_query = self.double_check_sql(user_query, sql_query, entities)
+            if sql_query is None:
+                return self._error("Can't create correct sql query")
 
         logger.info(f"Executing SQL query: {sql_query}")
-        result = self.execute_sql_query(sql_query)
-        
+        sql_query, result = self.execute_with_repair(user_query, sql_query, entities)
+        return self._finish(result, sql_query, cache_key, meta)
+
+    @traced("db_tool")
+    async def atool(self, user_query: str) -> dict[str, Union[str, list[dict]]]:
+        """Async version of `tool`, LLM calls use `ainvoke` and SQL is executed in a thread pool.
+
+        Args:
+            user_query (str): The natural language query from the user.
+        """
+        meta = {"user_query": user_query}
+        logger.info(f"Processing user query: '{user_query}'")
+
+        cache_key, cached = self._cache_lookup(user_query)
+        if cached is not None:
+            result = cached.get("result")
+            if result is None:
+                result = await self.aexecute_sql_query(cached["sql"])
+            if not isinstance(result, str):
+                return self._format_result(result, cached["sql"], meta)
+            logger.warning("Cached SQL query failed, running full pipeline")
+
+        # fuzzy matching is cpu bound, so it's done in a thread pool like sql execution
+        entities = await asyncio.to_thread(self._resolved_entities, user_query)
+        check_valid, message, sql_query = await self.acheck_and_generate(user_query, entities)
+
+        if not check_valid:
+            logger.warning(f"Query validation failed for: '{user_query}' - Reason: {message}")
+            return self._error(message)
+
+        logger.info(f"Generated SQL query: {sql_query}")
+
+        sql_query = await self.avalidate_sql(user_query, sql_query, entities)
+        if sql_query is None:
+            return self._error("Can't create correct sql query")
+
+        if self.double_check:
+            sql_query = await self.adouble_check_sql(user_query, sql_query, entities)
+            if sql_query is None:
+                return self._error("Can't create correct sql query")
+
+        logger.info(f"Executing SQL query: {sql_query}")
+        sql_query, result = await self.aexecute_with_repair(user_query, sql_query, entities)
+        return self._finish(result, sql_query, cache_key, meta)
+
+    def _cache_lookup(self, user_query: str) -> tuple[Optional[tuple], Optional[dict]]:
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.key(user_query, self.model_name, self.double_check)
+        cached = self.cache.get(cache_key)
+        current_span().set(cache_hit=cached is not None)
+        if cached is not None:
+            logger.info(f"Cache hit, using SQL query: {cached['sql']}")
+        return cache_key, cached
+
+    @staticmethod
+    def _error(message: str) -> dict:
+        current_span().fail(message)
+        return {"error": message, "result": "[]"}
+
+    def _finish(self, result, sql_query: str, cache_key: Optional[tuple], meta: dict):
         if isinstance(result, str):
             logger.error(f"SQL execution failed: {result}")
-            return {"error": result, "result": "[]"}
+            return self._error(result)
+
+        if cache_key is not None:
+            self.cache.set(cache_key, sql_query, result)
+
+        return self._format_result(result, sql_query, meta)
+
+    def _format_result(self, result: pd.DataFrame, sql_query: str, meta: dict):
+        current_span().set(rows=len(result))
+        # full result is kept in the result store, so users can see it without LLM,
+        # model gets only a preview with the result id
+        if self.result_store is not None:
+            try:
+                meta["result_id"] = self.result_store.put(result, sql_query=sql_query, user_query=meta["user_query"])
+                meta["row_count"] = len(result)
+            except Exception as e:  # e.g. duplicate column names, result is still returned to the model
+                logger.error(f"Failed to store result: {str(e)}")
 
-        # workaround
-        # st.session_state doesn't work and doesn't allow to save a table and show to the user without LLM
-        # to overcome this separate db is needed to store temporary table
         if len(result) > self.truncation_limit:
             logger.info(f"Result truncated: original length {len(result)}, truncated to {self.truncation_limit}")
             meta["truncated"] = f"Original length is {len(result)}, truncated to {self.truncation_limit}."
-            return result, {
-                "result": result.head(self.truncation_limit).to_json(orient="records"),
-                **meta,
-            }
+            result = result.head(self.truncation_limit)
+        else:
+            logger.info(f"Query completed successfully, returning {len(result)} rows")
+
+        return {"result": encode_result(result, self.result_format), "format": self.result_format, **meta}
+
+    def check_and_generate(self, user_query: str, entities: Optional[str] = None) -> tuple[bool, str, Optional[str]]:
+        """Check the user query and generate SQL for it.
+
+        Generation doesn't depend on the check, so in parallel mode both LLM calls are sent at once
+        and generated SQL is dropped if the check fails, which saves one LLM round-trip for valid queries.
+
+        Args:
+            user_query (str): The natural language query from the user.
+            entities: resolved names for the generation prompt, resolved from `user_query` if not set
+
+        Returns:
+            is query valid, check message and generated SQL (None if query is not valid)
+        """
+        if not self.parallel:
+            logger.debug("Starting query validation")
+            check_valid, message = self.check_nlq(user_query)
+            if not check_valid:
+                return False, message, None
+            logger.info("Query validation passed, starting SQL query generation")
+            return True, message, self.generate_sql_query(user_query, entities)
+
+        logger.debug("Starting query validation and SQL query generation in parallel")
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            # copied context, so spans of both calls are nested in the current one
+            check_future = executor.submit(contextvars.copy_context().run, self.check_nlq, user_query)
+            sql_future = executor.submit(
+                contextvars.copy_context().run, self.generate_sql_query, user_query, entities
+            )
+            check_valid, message = check_future.result()
+            if not check_valid:
+                return False, message, None
+            logger.info("Query validation passed")
+            return True, message, sql_future.result()
+        finally:
+            # don't wait for generation if the query is rejected
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def acheck_and_generate(
+        self, user_query: str, entities: Optional[str] = None
+    ) -> tuple[bool, str, Optional[str]]:
+        """Async version of `check_and_generate`."""
+        if not self.parallel:
+            check_valid, message = await self.acheck_nlq(user_query)
+            if not check_valid:
+                return False, message, None
+            logger.info("Query validation passed, starting SQL query generation")
+            return True, message, await self.agenerate_sql_query(user_query, entities)
 
-        logger.info(f"Query completed successfully, returning {len(result)} rows")
-        return {"result": result.to_json(orient="records"), **meta}
+        sql_task = asyncio.create_task(self.agenerate_sql_query(user_query, entities))
+        try:
+            check_valid, message = await self.acheck_nlq(user_query)
+        except BaseException:
+            sql_task.cancel()
+            raise
+        if not check_valid:
+            sql_task.cancel()
+            return False, message, None
+        logger.info("Query validation passed")
+        return True, message, await sql_task
+
+    # Control flow of validation, review and repair is shared by the sync and async api:
+    # `_*_steps` generators yield (method name, *args) for every llm call or blocking local call
+    # and get its result back, `_run_steps` calls the method, `_arun_steps` its async version
+    # ("a" + name) or runs it in a thread pool, so the event loop is never blocked.
+    def _run_steps(self, steps: _Steps):
+        result = None
+        try:
+            while True:
+                name, *args = steps.send(result)
+                result = getattr(self, name)(*args)
+        except StopIteration as e:
+            return e.value
+
+    async def _arun_steps(self, steps: _Steps):
+        result = None
+        try:
+            while True:
+                name, *args = steps.send(result)
+                async_method = getattr(self, "a" + name, None)
+                if async_method is not None:
+                    result = await async_method(*args)
+                else:
+                    result = await asyncio.to_thread(getattr(self, name), *args)
+        except StopIteration as e:
+            return e.value
+
+    def _validate_locally(self, sql_query: str) -> tuple[bool, str]:
+        return self.validator.validate(sql_query)
+
+    @traced("validate_sql")
+    def validate_sql(self, user_query: str, sql_query: str, entities: Optional[str] = None) -> Optional[str]:
+        """Check SQL locally against the table schema and regenerate it with the exact error if it's invalid.
+
+        Args:
+            user_query (str): The natural language query from the user.
+            sql_query (str): generated SQL query
+            entities: resolved names of `user_query`, resolved on the first regeneration if not set
+
+        Returns:
+            valid SQL query or None if it wasn't fixed in `sql_fix_attempts` regenerations
+        """
+        if self.validator is None:
+            return sql_query
+        return self._run_steps(self._validate_sql_steps(user_query, sql_query, entities))
+
+    @traced("validate_sql")
+    async def avalidate_sql(self, user_query: str, sql_query: str, entities: Optional[str] = None) -> Optional[str]:
+        """Async version of `validate_sql`."""
+        if self.validator is None:
+            return sql_query
+        return await self._arun_steps(self._validate_sql_steps(user_query, sql_query, entities))
+
+    def _validate_sql_steps(self, user_query: str, sql_query: str, entities: Optional[str]) -> _Steps:
+        for i in range(self.sql_fix_attempts + 1):
+            is_valid, error = yield ("_validate_locally", sql_query)
+            if is_valid:
+                return sql_query
+            if i == self.sql_fix_attempts:
+                break
+            logger.warning(f"Local SQL validation failed: {error}, regenerating query")
+            current_span().add("regenerations")
+            if entities is None:
+                entities = yield ("_resolved_entities", user_query)
+            prompt = prompt_regenerate_sql.format(
+                user_query=user_query, sql_query=sql_query, review=f"SQL validation error: {error}"
+            )
+            sql_query = yield ("generate_sql_query", prompt, entities)
+            logger.info(f"Regenerated SQL query: {sql_query}")
+        logger.error(f"Failed to generate valid SQL query: {error}")
+        return None
+
+    @traced("double_check_sql")
+    def double_check_sql(self, user_query: str, sql_query: str, entities: Optional[str] = None) -> Optional[str]:
+        """Review generated SQL with the model and regenerate it if needed.
+
+        Returns:
+            SQL query that passed the review or None if it's not possible to create correct one
+        """
+        return self._run_steps(self._double_check_sql_steps(user_query, sql_query, entities))
+
+    @traced("double_check_sql")
+    async def adouble_check_sql(self, user_query: str, sql_query: str, entities: Optional[str] = None) -> Optional[str]:
+        """Async version of `double_check_sql`."""
+        return await self._arun_steps(self._double_check_sql_steps(user_query, sql_query, entities))
+
+    def _double_check_sql_steps(self, user_query: str, sql_query: str, entities: Optional[str]) -> _Steps:
+        logger.info("Double-check enabled, validating generated SQL")
+        for i in range(3):  # TODO: move to params
+            logger.debug(f"SQL validation attempt #{i + 1}")
+            sql_check = yield ("simple_check_sql", user_query, sql_query)
+            logger.debug(f"SQL validation results: {json.dumps(sql_check, indent=2)}")
+
+            if sql_check["is_correct"]:
+                logger.info(f"SQL validation passed on attempt #{i + 1}")
+                return sql_query
+
+            logger.warning(f"SQL validation failed on attempt #{i + 1}, regenerating query")
+            current_span().add("regenerations")
+            if entities is None:
+                entities = yield ("_resolved_entities", user_query)
+            prompt = prompt_regenerate_sql.format(user_query=user_query, sql_query=sql_query, review=sql_check)
+            sql_query = yield ("generate_sql_query", prompt, entities)
+            sql_query = yield ("validate_sql", user_query, sql_query, entities)
+            if sql_query is None:
+                return None
+            logger.info(f"Regenerated SQL query: {sql_query}")
+
+        logger.warning("Maximum SQL validation attempts reached, performing final check")
+        sql_check = yield ("simple_check_sql", user_query, sql_query)
+        logger.debug(f"Final SQL validation results: {json.dumps(sql_check, indent=2)}")
+        if not sql_check["is_correct"]:
+            logger.error("Failed to generate correct SQL query after all attempts")
+            return None
+        return sql_query
+
+    def _messages(self, prompt: str, name: str) -> list[Union[SystemMessage, HumanMessage]]:
+        logger.debug(
+            f"Sending {name} prompt to model "
+            f"(tokens: {self.prompt_tokens['system']} system + {count_tokens(prompt, self.model_name)})"
+        )
+        return [SystemMessage(content=self.system_prompt), HumanMessage(content=prompt)]
+
+    def _check_nlq_messages(self, user_query: str) -> list[Union[SystemMessage, HumanMessage]]:
+        # TODO: move to a db with RBAC and remove read-only check
+        return self._messages(nlq_check_prompt + user_query, "validation")
+
+    @staticmethod
+    def _parse_check_nlq(response: dict) -> tuple[bool, str]:
+        logger.debug(f"Model validation response: {json.dumps(response, indent=2)}")
+        if response["is_valid"]:
+            logger.debug("Query validation successful")
+            return True, "Query is valid."
+        logger.debug(f"Query validation failed: {response['message']}")
+        return False, response["message"]
 
     @retry(tries=2)
+    @traced("check_nlq")
     def check_nlq(self, user_query: str):
         """Check if the user query requires a read-only permission only
         i.e. doesn't plan to change data in the database
@@ -128,40 +472,43 @@ class DBAgent:
         """
         logger.debug(f"Validating natural language query: '{user_query}'")
         
-        # TODO: move to a db with RBAC and remove read-only check
-        prompt = nlq_check_prompt.format(context=data_context) + user_query
-        logger.debug(f"Sending validation prompt to model (length: {len(prompt)} chars)")
-        
         try:
-            response = self.model.invoke([HumanMessage(content=prompt)])
-            logger.debug(f"Model validation response: {json.dumps(response, indent=2)}")
-            
-            if response["is_valid"]:
-                logger.debug("Query validation successful")
-                return True, "Query is valid."
-            else:
-                logger.debug(f"Query validation failed: {response['message']}")
-                return False, response["message"]
+            response = self.model.invoke(self._check_nlq_messages(user_query), config=llm_config())
+            return self._parse_check_nlq(response)
+        except Exception as e:
+            logger.error(f"Error during query validation: {str(e)}")
+            return False, f"Validation error: {str(e)}"
+
+    @aretry(tries=2)
+    @traced("check_nlq")
+    async def acheck_nlq(self, user_query: str):
+        """Async version of `check_nlq`."""
+        logger.debug(f"Validating natural language query: '{user_query}'")
+
+        try:
+            response = await self.model.ainvoke(self._check_nlq_messages(user_query), config=llm_config())
+            return self._parse_check_nlq(response)
         except Exception as e:
             logger.error(f"Error during query validation: {str(e)}")
             return False, f"Validation error: {str(e)}"
 
     @retry(tries=2)
-    def generate_sql_query(self, user_query: str) -> str:
+    @traced("generate_sql_query")
+    def generate_sql_query(self, user_query: str, entities: Optional[str] = None) -> str:
         """Generate SQL query from the user query using the model.
 
         Args:
-            user_query (str): The natural language query from the user.
+            user_query (str): The natural language query from the user (or regenerate/repair prompt).
+            entities: resolved names of the original question, see `_resolved_entities`,
+                resolved from `user_query` if not set, so pass it for regenerate/repair prompts
 
         Returns:
             str: The generated SQL query.
         """
         logger.debug(f"Generating SQL for query: '{user_query}'")
-        prompt_ = nlq_to_sql_prompt + user_query
-        logger.debug(f"Sending SQL generation prompt to model (length: {len(prompt_)} chars)")
         
         try:
-            response = self.model.invoke([HumanMessage(content=prompt_)])
+            response = self.model.invoke(self._generate_sql_messages(user_query, entities), config=llm_config())
             sql_query = response["query"]
             logger.debug(f"Model generated SQL: {sql_query}")
             return sql_query
@@ -169,7 +516,79 @@ class DBAgent:
             logger.error(f"Error generating SQL query: {str(e)}")
             raise
 
-    @retry(tries=2)
+    @aretry(tries=2)
+    @traced("generate_sql_query")
+    async def agenerate_sql_query(self, user_query: str, entities: Optional[str] = None) -> str:
+        """Async version of `generate_sql_query`."""
+        logger.debug(f"Generating SQL for query: '{user_query}'")
+
+        try:
+            response = await self.model.ainvoke(
+                self._generate_sql_messages(user_query, entities), config=llm_config()
+            )
+            sql_query = response["query"]
+            logger.debug(f"Model generated SQL: {sql_query}")
+            return sql_query
+        except Exception as e:
+            logger.error(f"Error generating SQL query: {str(e)}")
+            raise
+
+    def _generate_sql_messages(
+        self, user_query: str, entities: Optional[str] = None
+    ) -> list[Union[SystemMessage, HumanMessage]]:
+        if entities is None:
+            entities = self._resolved_entities(user_query)
+        return self._messages(nlq_to_sql_prompt + user_query + entities, "SQL generation")
+
+    def _resolved_entities(self, user_query: str) -> str:
+        if self.entity_resolver is None:
+            return ""
+        entities = self.entity_resolver.resolve(user_query)
+        if not entities:
+            return ""
+        lines = []
+        for entity in entities:
+            values = ", ".join("'{}'".format(v.replace("'", "''")) for v in entity["values"])
+            closest = "" if entity["exact"] else " (closest match)"
+            lines.append(f'- "{entity["text"]}" -> {entity["column"]}: {values}{closest}')
+        logger.info(f"Resolved {len(entities)} entities in the user query")
+        return prompt_resolved_entities.format(entities="\n".join(lines))
+
+    def execute_with_repair(self, user_query: str, sql_query: str, entities: Optional[str] = None):
+        """Execute SQL query and if it fails regenerate it with the database error.
+
+        Only SQL generation is repeated, nlq check is not needed for the same user query,
+        and failing query is not re-run as is, since it would fail the same way.
+
+        Returns:
+            executed SQL query and its result (dataframe or error message)
+        """
+        return self._run_steps(self._execute_with_repair_steps(user_query, sql_query, entities))
+
+    async def aexecute_with_repair(self, user_query: str, sql_query: str, entities: Optional[str] = None):
+        """Async version of `execute_with_repair`."""
+        return await self._arun_steps(self._execute_with_repair_steps(user_query, sql_query, entities))
+
+    def _execute_with_repair_steps(self, user_query: str, sql_query: str, entities: Optional[str]) -> _Steps:
+        result = yield ("execute_sql_query", sql_query)
+        for i in range(self.sql_repair_attempts):
+            if not isinstance(result, str):
+                break
+            logger.warning(f"SQL execution failed, repairing query (attempt #{i + 1}): {result}")
+            current_span().add("repairs")
+            if entities is None:
+                entities = yield ("_resolved_entities", user_query)
+            prompt = prompt_repair_sql.format(user_query=user_query, sql_query=sql_query, error=result)
+            repaired_sql = yield ("generate_sql_query", prompt, entities)
+            repaired_sql = yield ("validate_sql", user_query, repaired_sql, entities)
+            if repaired_sql is None:
+                break
+            sql_query = repaired_sql
+            logger.info(f"Repaired SQL query: {sql_query}")
+            result = yield ("execute_sql_query", sql_query)
+        return sql_query, result
+
+    @traced("execute_sql_query")
     def execute_sql_query(self, sql_query: str):
         """Execute the SQL query against the database.
 
@@ -184,19 +603,27 @@ class DBAgent:
         try:
             result = self.db.query(sql_query)
             if isinstance(result, pd.DataFrame):
+                current_span().set(rows=len(result))
                 logger.info(f"SQL query executed successfully. Result shape: {result.shape}")
                 logger.debug(f"Result columns: {list(result.columns)}")
                 return result
             else:
                 logger.error(f"SQL query execution returned non-DataFrame result: {type(result)} - {result}")
+                current_span().fail("Non-DataFrame result")
                 return "Query execution failed."
         except Exception as e:
             logger.error(f"Exception during SQL query execution: {str(e)}")
+            current_span().fail(str(e))
             return f"Query execution failed: {str(e)}"
 
+    async def aexecute_sql_query(self, sql_query: str):
+        """Async version of `execute_sql_query`, query is executed in a thread pool to not block the event loop."""
+        return await asyncio.to_thread(self.execute_sql_query, sql_query)
+
     # this just doesn't work in general
     # it should be a different approach
     @retry(tries=2)
+    @traced("simple_check_sql")
     def simple_check_sql(self, query, sql):
         """Validate the generated SQL query against the original natural language query.
         
@@ -210,15 +637,27 @@ class DBAgent:
         logger.debug(f"Validating SQL query: {sql}")
         logger.debug(f"Against natural language query: {query}")
         
-        prompt = prompt_simple_check_sql.format(
-            sql=sql, query=query, data_context=data_context, sql_context=sql_context
-        )
-        logger.debug(f"Sending SQL validation prompt to model (length: {len(prompt)} chars)")
-        
         try:
-            res = self.model.invoke([HumanMessage(prompt)])
+            res = self.model.invoke(self._simple_check_sql_messages(query, sql), config=llm_config())
+            logger.debug(f"SQL validation model response: {json.dumps(res, indent=2)}")
+            return res
+        except Exception as e:
+            logger.error(f"Error during SQL validation: {str(e)}")
+            return {"is_correct": False, "message": f"Validation error: {str(e)}"}
+
+    @aretry(tries=2)
+    @traced("simple_check_sql")
+    async def asimple_check_sql(self, query, sql):
+        """Async version of `simple_check_sql`."""
+        logger.debug(f"Validating SQL query: {sql}")
+
+        try:
+            res = await self.model.ainvoke(self._simple_check_sql_messages(query, sql), config=llm_config())
             logger.debug(f"SQL validation model response: {json.dumps(res, indent=2)}")
             return res
         except Exception as e:
             logger.error(f"Error during SQL validation: {str(e)}")
             return {"is_correct": False, "message": f"Validation error: {str(e)}"}
+
+    def _simple_check_sql_messages(self, query: str, sql: str) -> list[Union[SystemMessage, HumanMessage]]:
+        return self._messages(prompt_simple_check_sql.format(sql=sql, query=query), "SQL validation")
@@ -0,0 +1,77 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional
+
+from ats.logger import get_logger
+
+logger = get_logger(name="query_cache")
+
+
+class QueryCache:
+    """LRU cache with TTL for validated sql queries, and optionally their results.
+
+    Key is normalized user query + model + double_check, so the same question
+    asked again (e.g. "How many patients does doctor X have?" that chat agent rewrites the same way every time)
+    doesn't go through nlq check and sql generation again.
+    It's in-process and shared between sessions, data is static, so there is nothing to invalidate except by TTL.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 3600, cache_results: bool = False):
+        """
+        Args:
+            max_size: max number of entries, least recently used are evicted
+            ttl: time to live of an entry in seconds, None means forever
+            cache_results: store result dataframes too, not only sql
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_results = cache_results
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[tuple, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(user_query: str) -> str:
+        """Lowercase, unify unicode and whitespaces, drop punctuation at the end."""
+        query = unicodedata.normalize("NFKC", user_query).casefold()
+        query = re.sub(r"\s+", " ", query).strip()
+        return query.rstrip("?!. ")
+
+    def key(self, user_query: str, model_name: Optional[str], double_check: bool) -> tuple:
+        return self.normalize(user_query), model_name, double_check
+
+    def get(self, key: tuple) -> Optional[dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                logger.debug(f"Cache miss: {key}")
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            logger.debug(f"Cache hit: {key}")
+            return entry[1]
+
+    def set(self, key: tuple, sql_query: str, result=None):
+        value = {"sql": sql_query}
+        if self.cache_results and result is not None:
+            value["result"] = result
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
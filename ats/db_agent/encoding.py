@@ -0,0 +1,68 @@
+import io
+import json
+import re
+from typing import Union
+
+import pandas as pd
+
+# "records" - list of dicts, column names are repeated in every row (original format)
+# "columns" - {"columns": [...], "data": [[...], ...]}, column names only once
+# "csv" - csv table with header row, the most compact one
+RESULT_FORMATS = ("records", "columns", "csv")
+
+# timestamps at midnight, as sqlite returns them, e.g. "2020-01-01 00:00:00.000000"
+_MIDNIGHT_SUFFIX = re.compile(r"^(\d{4}-\d{2}-\d{2})[ T]00:00:00(?:\.0+)?$")
+
+
+def _compact_values(df: pd.DataFrame, float_decimals: int) -> pd.DataFrame:
+    df = df.copy()
+    # positional, result may have duplicated column names
+    for i in range(df.shape[1]):
+        series = df.iloc[:, i]
+        if series.dtype.kind == "f":
+            # small values like ratios would turn into zeros with the same precision as money
+            decimals = float_decimals if series.abs().max() >= 1 else float_decimals + 2
+            df.isetitem(i, series.round(decimals))
+        elif series.dtype.kind == "M":
+            if (series.dropna() == series.dropna().dt.normalize()).all():
+                df.isetitem(i, series.dt.strftime("%Y-%m-%d"))
+            else:
+                df.isetitem(i, series.dt.strftime("%Y-%m-%d %H:%M:%S"))
+        elif series.dtype.kind == "O":
+            df.isetitem(i, series.map(lambda x: _MIDNIGHT_SUFFIX.sub(r"\1", x) if isinstance(x, str) else x))
+    return df
+
+
+def encode_result(df: pd.DataFrame, fmt: str = "columns", float_decimals: int = 2) -> Union[list, dict, str]:
+    """Encode query result for a tool message.
+
+    Floats are rounded and dates are written without time, so the model gets fewer tokens.
+    Result is a json-native object (or csv string), so the tool message is encoded only once.
+
+    Args:
+        df: query result
+        fmt: one of `RESULT_FORMATS`
+        float_decimals: number of decimals to round floats to
+
+    Returns:
+        encoded result
+    """
+    if fmt not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result format: {fmt}, available: {RESULT_FORMATS}")
+    df = _compact_values(df, float_decimals)
+    if fmt == "csv":
+        return df.to_csv(index=False)
+    if fmt == "columns":
+        return json.loads(df.to_json(orient="split", index=False))
+    return json.loads(df.to_json(orient="records"))
+
+
+def decode_result(payload: Union[list, dict, str], fmt: str = "records") -> pd.DataFrame:
+    """Decode result from a tool message back to dataframe, see `encode_result`."""
+    if fmt == "csv":
+        return pd.read_csv(io.StringIO(payload))
+    if isinstance(payload, str):  # older tool messages had json string inside json
+        payload = json.loads(payload)
+    if fmt == "columns":
+        return pd.DataFrame(payload["data"], columns=payload["columns"])
+    return pd.DataFrame(payload)
@@ -0,0 +1,174 @@
+import difflib
+import re
+from collections import Counter, defaultdict
+from typing import Optional
+
+from ats.db_connector import SEARCHABLE_COLUMNS, tokenize
+from ats.logger import get_logger
+
+try:  # optional, much faster fuzzy matching over all values
+    from rapidfuzz import fuzz, process
+except ImportError:
+    fuzz = process = None
+
+logger = get_logger(name="entity_resolution")
+
+# longest name (in words) that is looked up, hospitals are like "Moreno Murphy, Griffith and"
+MAX_ENTITY_WORDS = 5
+
+# words that never make an entity on their own
+_STOPWORDS = {
+    "a", "an", "and", "or", "the", "of", "in", "at", "on", "for", "to", "from", "by", "with", "is", "are",
+    "was", "were", "how", "many", "much", "what", "which", "who", "whose", "when", "where", "all", "any",
+    "doctor", "doctors", "dr", "patient", "patients", "hospital", "hospitals", "named", "name",
+}
+
+# "John Smith", "Moreno Murphy, Griffith and" - capitalized words are the likely names for fuzzy matching
+_CAPITALIZED_RUN_RE = re.compile(r"\b[A-Z][\w'-]*(?:,?\s+(?:and\s+)?[A-Z][\w'-]*)+")
+_QUOTED_RE = re.compile(r"['\"]([^'\"]{3,})['\"]")
+
+
+def _key(text: str) -> str:
+    # word order and punctuation don't matter, "Murphy and Moreno" == "moreno, murphy and", "O'Brien" == "obrien"
+    return " ".join(sorted(tokenize(text.replace("'", ""))))
+
+
+def _trigrams(key: str) -> set[str]:
+    padded = f" {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class EntityResolver:
+    """Grounds names from a natural language query in the actual values of Name/Doctor/Hospital.
+
+    Every word span of the query is looked up exactly (same set of words as a value),
+    capitalized or quoted spans that don't match exactly are looked up in the token index of the database
+    (values containing all their words, e.g. "Moreno Murphy" -> "Moreno Murphy, Griffith and")
+    and only then matched fuzzily to catch typos.
+    Resolved values are added to the sql generation prompt, so the model filters with exact values
+    instead of guessing LIKE patterns.
+    Fuzzy matching uses rapidfuzz if it's installed, otherwise a trigram shortlist scored with difflib.
+    """
+
+    def __init__(
+        self,
+        db,
+        columns: Optional[list[str]] = None,
+        score_cutoff: float = 80,
+        max_values: int = 3,
+    ):
+        """
+        Args:
+            db: `Database`, distinct values and partial name lookups come from its token index
+            columns: columns to resolve entities in, `SEARCHABLE_COLUMNS` by default
+            score_cutoff: min fuzzy similarity (0-100) of a match
+            max_values: max number of values per entity, more matches mean the name is ambiguous
+        """
+        self.db = db
+        self.score_cutoff = score_cutoff
+        self.max_values = max_values
+        self.values: dict[str, list[str]] = {}
+        self._keys: dict[str, list[str]] = {}
+        self._exact: dict[str, dict[str, list[str]]] = {}
+        self._trigrams: dict[str, dict[str, list[int]]] = {}
+
+        for col in columns or SEARCHABLE_COLUMNS:
+            values = db.name_index.values.get(col)
+            if values is None:
+                continue
+            keys = [_key(v) for v in values]
+            exact = defaultdict(list)
+            for key, value in zip(keys, values):
+                exact[key].append(value)
+            self.values[col] = values
+            self._keys[col] = keys
+            self._exact[col] = dict(exact)
+            if process is None:
+                trigrams = defaultdict(list)
+                for i, key in enumerate(keys):
+                    for trigram in _trigrams(key):
+                        trigrams[trigram].append(i)
+                self._trigrams[col] = dict(trigrams)
+        logger.info(f"Entity resolver built for columns: {list(self.values)}")
+
+    def resolve(self, user_query: str) -> list[dict]:
+        """Find names of patients, doctors and hospitals in the query.
+
+        Args:
+            user_query: natural language query
+
+        Returns:
+            list of {"text": span of the query, "column": column, "values": canonical values, "exact": bool}
+        """
+        entities = []
+        covered = set()  # positions of words that are already part of an exact match
+        words = list(re.finditer(r"[^\W_]+", user_query))
+        # longest spans first, so "John Smith" wins over "John"
+        for size in range(min(MAX_ENTITY_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                positions = set(range(start, start + size))
+                if positions & covered:
+                    continue
+                span = user_query[words[start].start() : words[start + size - 1].end()]
+                if all(t in _STOPWORDS or t.isdigit() for t in tokenize(span)):
+                    continue
+                key = _key(span)
+                for col, exact in self._exact.items():
+                    values = exact.get(key)
+                    if values:
+                        entities.append(
+                            {"text": span, "column": col, "values": values[: self.max_values], "exact": True}
+                        )
+                        covered |= positions
+        for span in self._fuzzy_candidates(user_query, entities):
+            partial = {col: self._partial_match(col, span) for col in self.values}
+            for col in self.values:
+                # fuzzy matching only if no column has values with all the words
+                values = partial[col] or (None if any(partial.values()) else self._fuzzy_match(col, _key(span)))
+                if values:
+                    entities.append({"text": span, "column": col, "values": values, "exact": False})
+        if entities:
+            logger.debug(f"Resolved entities: {entities}")
+        return entities
+
+    def _fuzzy_candidates(self, user_query: str, entities: list[dict]) -> list[str]:
+        resolved = {token for e in entities for token in _key(e["text"]).split()}
+        spans = [m.group(0) for m in _CAPITALIZED_RUN_RE.finditer(user_query)]
+        spans += [m.group(1) for m in _QUOTED_RE.finditer(user_query)]
+        candidates = []
+        for span in spans:
+            # drop leading words like "Doctor" in "Doctor Jon Smtih"
+            tokens = tokenize(span.replace("'", ""))
+            while tokens and tokens[0] in _STOPWORDS:
+                tokens.pop(0)
+            key = " ".join(tokens)
+            # spans overlapping exact matches are already resolved, e.g. "Compare John Smith"
+            if len(tokens) >= 2 and not resolved.intersection(tokens) and key not in candidates:
+                candidates.append(key)
+        return candidates
+
+    def _partial_match(self, column: str, span: str) -> list[str]:
+        # every word has to be in the index, so typos go to fuzzy matching,
+        # more than `max_values` values mean the span is too generic, e.g. just a common surname
+        values = self.db.resolve_name(column, span, limit=self.max_values + 1, all_words=True)
+        return values if len(values) <= self.max_values else []
+
+    def _fuzzy_match(self, column: str, key: str) -> list[str]:
+        keys = self._keys[column]
+        if process is not None:
+            matches = process.extract(
+                key, keys, scorer=fuzz.ratio, limit=self.max_values, score_cutoff=self.score_cutoff
+            )
+            ids = [i for _, _, i in matches]
+        else:
+            # shortlist values sharing the most trigrams, then score only them
+            counts = Counter()
+            for trigram in _trigrams(key):
+                counts.update(self._trigrams[column].get(trigram, ()))
+            scored = []
+            for i, _ in counts.most_common(200):
+                score = difflib.SequenceMatcher(None, key, keys[i]).ratio() * 100
+                if score >= self.score_cutoff:
+                    scored.append((score, i))
+            ids = [i for _, i in sorted(scored, reverse=True)[: self.max_values]]
+        return [self.values[column][i] for i in ids]
@@ -1,8 +1,10 @@
 import json
 
-nlq_to_sql_prompt = """You are a SQL query generator. 
-
-Given a natural language question, generate a SQL query that retrieves the requested data from the healthcare dataset.
+# static part of every db agent call, goes into the system message, see `system_prompt`.
+# it's the same for all calls of an agent, so provider-side prompt caching (exact prefix match) applies to it,
+# variable parts (user query, sql, errors) go only to the end of the human message
+system_prompt_template = """You are a SQL expert working with the healthcare dataset described below.
+You generate SQL queries that retrieve the requested data, check user queries and review SQL queries.
 
 Write ONLY read-only SQL queries. Do not write any data manipulation or modification queries.
 ---
@@ -13,47 +15,40 @@ Data:
 
 Database and SQL:
 {sql_context}
----
-Response is a json with the following format:
-{{
-    "query": your_sql_query
-}}
----
-User query:
 """
 
-data_context = """There is one and only one table named 'df' that you can use. Table length is 50000 rows.
+data_intro = """There is one and only one table named 'df' that you can use. Table length is 50000 rows.
 It contains healthcare records with all necessary information described below, so you can derive insights from it.
 
 Single record in this healthcare dataset represents one patient's complete hospital admission episode, not one patient.
 It means that if a patient was admitted multiple times, there will be multiple records for that patient.
 And e.g. doctor's name in a record means that the patient from this record is doctor's patient, i.e. this table/database is not normalized and can be treated like a list of transactions from which you can derive info.
+"""
 
-Columns in the table, use exact column names in exact case in the query:         
-{
+column_descriptions = {
     "Patient_ID": "Unique identifier for the patient.",
     "Name": "This column represents the name of the patient associated with the healthcare record.",
     "Year_of_Birth": "Year of birth of the patient.",
     "Age": "The age of the patient at the time of admission, expressed in years.",
-    "Gender": "Indicates the gender of the patient, either \"Male\" or \"Female.\"",
-    "Blood_Type": "The patient's blood type, which can be one of the common blood types (e.g., \"A+\", \"O-\", etc.).",
-    "Medical_Condition": "Specifies the primary medical condition or diagnosis associated with the patient, such as \"Diabetes,\" \"Hypertension,\" \"Asthma,\" and more.",
+    "Gender": 'Indicates the gender of the patient, either "Male" or "Female."',
+    "Blood_Type": 'The patient\'s blood type, which can be one of the common blood types (e.g., "A+", "O-", etc.).',
+    "Medical_Condition": 'Specifies the primary medical condition or diagnosis associated with the patient, such as "Diabetes," "Hypertension," "Asthma," and more.',
     "Date_of_Admission": "The date on which the patient was admitted to the healthcare facility.",
     "Doctor": "The name of the doctor responsible for the patient's care during their admission.",
     "Hospital": "Identifies the healthcare facility or hospital where the patient was admitted.",
-    "Insurance_Provider": "Indicates the patient's insurance provider, which can be one of several options, including \"Aetna,\" \"Blue Cross,\" \"Cigna,\" \"UnitedHealthcare,\" and \"Medicare.\"",
+    "Insurance_Provider": 'Indicates the patient\'s insurance provider, which can be one of several options, including "Aetna," "Blue Cross," "Cigna," "UnitedHealthcare," and "Medicare."',
     "Billing_Amount": "The amount of money billed for the patient's healthcare services during their admission. This is expressed as a floating-point number.",
     "Room_Number": "The room number where the patient was accommodated during their admission.",
-    "Admission_Type": "Specifies the type of admission, which can be \"Emergency,\" \"Elective,\" or \"Urgent,\" reflecting the circumstances of the admission.",
+    "Admission_Type": 'Specifies the type of admission, which can be "Emergency," "Elective," or "Urgent," reflecting the circumstances of the admission.',
     "Discharge_Date": "The date on which the patient was discharged from the healthcare facility, based on the admission date and a random number of days within a realistic range.",
-    "Medication": "Identifies a medication prescribed or administered to the patient during their admission. Examples include \"Aspirin,\" \"Ibuprofen,\" \"Penicillin,\" \"Paracetamol,\" and \"Lipitor.\"",
-    "Test_Results": "Describes the results of a medical test conducted during the patient's admission. Possible values include \"Normal,\" \"Abnormal,\" or \"Inconclusive,\" indicating the outcome of the test."
+    "Medication": 'Identifies a medication prescribed or administered to the patient during their admission. Examples include "Aspirin," "Ibuprofen," "Penicillin," "Paracetamol," and "Lipitor."',
+    "Test_Results": 'Describes the results of a medical test conducted during the patient\'s admission. Possible values include "Normal," "Abnormal," or "Inconclusive," indicating the outcome of the test.',
 }
 
-Data types: {
+column_types = {
     "Patient_ID": "int64",
     "Name": "string",
-    "Year of Birth": "int64"
+    "Year_of_Birth": "int64",
     "Age": "int64",
     "Gender": "string",
     "Blood_Type": "string",
@@ -67,10 +62,13 @@ Data types: {
     "Admission_Type": "string",
     "Discharge_Date": "datetime64[ns]",
     "Medication": "string",
-    "Test_Results": "string"
+    "Test_Results": "string",
 }
 
-VERY IMPORTANT NOTES:
+# short type names for the compact schema
+_compact_types = {"int64": "int", "string": "text", "float64": "float", "datetime64[ns]": "datetime"}
+
+data_notes = """VERY IMPORTANT NOTES:
 - columns ["Name", "Doctor", "Hospital"] are not in lowercase, but you need to perform search in lowercase to avoid case sensitivity issues (but the result should be in original case).
 - "Hospital" column contains 'broken' values in some way (e.g. "Moreno Murphy, Griffith and", here user may ask for "Moreno Murphy and Griffith" and expect to get this value, so in this case you can use two LIKE filters with AND).
 
@@ -85,36 +83,109 @@ You should use "LOWER(Name) = "john doe" in where condidtion for this.
 
 """
 
-sql_context = """
-- Use SQLite syntax to query the table, since your query will be executed with pandasql library.
-- Instead of e.g. "COUNT(*)" (or with other aggregations) as column name, you must use appropriate name like "something_count" or "something_number", etc.
+
+sql_rules = """- Instead of e.g. "COUNT(*)" (or with other aggregations) as column name, you must use appropriate name like "something_count" or "something_number", etc.
 - Use RANK() window function instead of LIMIT 1 to include all records that tie for the top value, cause sometimes there can be 
 """
 
-nlq_to_sql_prompt = nlq_to_sql_prompt.format(
-    data_context=data_context,
-    sql_context=sql_context
-)
+sql_context = """
+- Use SQLite syntax to query the table, since your query will be executed with SQLite.
+""" + sql_rules
+
+duckdb_sql_context = """
+- Use DuckDB syntax to query the table, since your query will be executed with DuckDB.
+- Date columns are TIMESTAMP, use DuckDB date functions, e.g. year(Date_of_Admission), date_diff('day', Date_of_Admission, Discharge_Date), strftime(Date_of_Admission, '%Y-%m').
+- Division of integers returns float, use // for integer division.
+""" + sql_rules
+
+# sql context per Database.dialect
+sql_contexts = {
+    "sqlite": sql_context,
+    "duckdb": duckdb_sql_context,
+}
+
+# added to data context when the engine has these indexes, i.e. SQLiteEngine (pandasql rebuilds the table per query)
+indexes_context = """
+Table 'df' has indexes on Patient_ID, Doctor, Hospital, Date_of_Admission and on LOWER(Name), LOWER(Doctor), LOWER(Hospital).
+To use them write filters exactly in this form: LOWER(Doctor) = 'john doe' (or LOWER(Doctor) IN (...)) when the full name is known,
+Patient_ID = 123, Date_of_Admission >= '2020-01-01' AND Date_of_Admission < '2021-01-01' (don't wrap the column in a function like strftime).
+LIKE '%word%' can't use indexes, use it only for partial or 'broken' names (e.g. hospitals).
+"""
+
+# added to data context when Database is created with materialize=True
+summary_tables_context = """
+Besides 'df' there are precomputed summary tables derived from it. They are much faster than aggregating 'df',
+so use them when a question can be answered with them (e.g. patient counts per doctor, comparison with an average doctor, hospital totals):
+- doctor_stats: one row per Doctor, columns: Doctor, admission_count, patient_count (distinct Patient_ID), hospital_count, total_billing_amount, avg_billing_amount, avg_length_of_stay_days, max_length_of_stay_days
+- hospital_stats: one row per Hospital, columns: Hospital, admission_count, patient_count, doctor_count, total_billing_amount, avg_billing_amount, avg_length_of_stay_days, max_length_of_stay_days
+- condition_stats: one row per Medical_Condition, columns: Medical_Condition, admission_count, patient_count, doctor_count, hospital_count, total_billing_amount, avg_billing_amount, avg_length_of_stay_days, max_length_of_stay_days
+Length of stay is Discharge_Date - Date_of_Admission in days. Use the same name search rules for Doctor and Hospital as for 'df'.
+For anything else (filters by date, gender, patient, etc.) use 'df'.
+"""
+
+
 
-nlq_check_prompt = """Check if this natural language query:
+def render_data_context(compact: bool = False, summary_tables: bool = False, indexes: bool = False) -> str:
+    """Description of the data for the system message.
+
+    Args:
+        compact: one line per column with a short type instead of separate json dicts of descriptions and types
+        summary_tables: describe summary tables of `Database(materialize=True)` too
+        indexes: describe indexes and filter forms that use them, see `Database.indexed`
+    """
+    intro = data_intro
+    if summary_tables:
+        intro = intro.replace("There is one and only one table named 'df' that you can use.", "The main table is named 'df'.")
+    if compact:
+        columns = "\n".join(
+            f"- {name} ({_compact_types[column_types[name]]}): {description}"
+            for name, description in column_descriptions.items()
+        )
+        columns = f"Columns in the table, use exact column names in exact case in the query:\n{columns}\n"
+    else:
+        columns = (
+            "Columns in the table, use exact column names in exact case in the query:\n"
+            f"{json.dumps(column_descriptions, indent=4)}\n\nData types: {json.dumps(column_types, indent=4)}\n"
+        )
+    context = f"{intro}\n{columns}\n{data_notes}"
+    if indexes:
+        context += indexes_context
+    if summary_tables:
+        context += summary_tables_context
+    return context
+
+
+def system_prompt(data_context: str, sql_context: str) -> str:
+    return system_prompt_template.format(data_context=data_context, sql_context=sql_context)
+
+
+data_context = render_data_context()
+
+nlq_to_sql_prompt = """Task: given a natural language question, generate a SQL query that retrieves the requested data from the healthcare dataset.
+---
+Response is a json with the following format:
+{
+    "query": your_sql_query
+}
+---
+User query:
+"""
+
+nlq_check_prompt = """Task: check if this natural language query:
     - doesn't plan to change data in the database, i.e. doesn't try to insert or delete or update data in the table/database
     - temporary tables for calculation and analysis are allowed
     - aligns with the database/table description.
 ---
-Data description:
-{context}
----
 Response format is a json with the following format:
-{{
+{
     "is_valid": true/false, # True if the query is valid, False otherwise
     "message": "Your message explaining the reason why the query is valid or not."  # skip if is_valid is True
-}}
+}
 ---
 User query:
 """
 
-prompt_simple_check_sql = """
-Check if provided sql solves corretly the task from natural language query (nlq).
+prompt_simple_check_sql = """Task: check if provided sql solves corretly the task from natural language query (nlq).
 
 Especially check each each point SEPARATELY regarding nlq AND MENTION IT IN FINAL REASONS:
 - cases when the nlq is complex and has references e.g. pronouns within the query, so "them" could refer to different entities
@@ -122,23 +193,15 @@ Especially check each each point SEPARATELY regarding nlq AND MENTION IT IN FINA
 - correctness of filtering with WHEN for string fields
 - correctness of RANK and LIMIT usage, e.g. sometimes when you need top-1 by a calculated number there may be not only one record with the highes score, but multiple, then you would need rank
 - correctness of grouping, e.g. there may be cases when you need to group-calculate-filter-group-calculate and not just group-group-calculate, because in first case you get e.g. top group in the first grouping and then top subgroup in this group, but in second case with double grouping you are looking for top subgroup among all subgroups from all groups, even though the task could be to extract top group from top subgroup, but it's only one of the possible cases
-
-SQL:
-{sql}
-
-Natural language query:
-{query}
 ---
 Output json format:
 {{"reasoning": "reasons behind your decision and what to change in case of incorrect sql", "is_correct": true/false}}
-
 ---
-Context
-Data context:
-{data_context}
-
-SQL context:
-{sql_context}
+Natural language query:
+{query}
+***
+SQL:
+{sql}
 """
 
 
@@ -151,4 +214,24 @@ Original sql query:
 {sql_query}
 ***
 Review: "{review}"
-"""
\ No newline at end of file
+"""
+
+
+prompt_repair_sql = """Given original user query and corresponding sql query that failed during execution, generate fixed version of the sql query.
+
+Original user query:
+{user_query}
+***
+Failed sql query:
+{sql_query}
+***
+Database error: "{error}"
+"""
+
+# appended to the generation prompt by `EntityResolver` pre-pass
+prompt_resolved_entities = """
+***
+Names from the user query that were found in the table. These are exact values in original case,
+filter with "=" (or "IN" if there are several) on the column instead of LOWER/LIKE:
+{entities}
+"""
@@ -0,0 +1,125 @@
+import sqlite3
+import threading
+from typing import Optional
+
+import pandas as pd
+
+from ats.db_connector import sqlite_schema
+from ats.logger import get_logger
+
+logger = get_logger(name="sql_validator")
+
+# everything else (insert, update, create, pragma, attach, ...) is denied
+_SQLITE_ALLOWED_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+
+
+def _sqlite_authorizer(action, *args):
+    return sqlite3.SQLITE_OK if action in _SQLITE_ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+
+class SQLValidator:
+    """Deterministic local check of generated SQL without executing it.
+
+    Query is compiled with EXPLAIN against an empty table with the same schema as the real one,
+    so syntax errors, unknown tables/columns/functions and write statements are caught
+    in microseconds and with precise error messages, that can be fed back to the LLM.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        table_name: str,
+        dialect: str = "sqlite",
+        extra_tables: Optional[dict[str, pd.DataFrame]] = None,
+    ):
+        """
+        Args:
+            df: main table, only schema is used
+            table_name: name of the main table
+            dialect: "sqlite" or "duckdb"
+            extra_tables: other tables available for queries, e.g. summary tables
+        """
+        self.table_name = table_name
+        self.dialect = dialect
+        self.columns = list(df.columns)
+        self.tables = [table_name, *(extra_tables or {})]
+        self._lock = threading.Lock()
+
+        tables = {table_name: df, **(extra_tables or {})}
+        if dialect == "duckdb":
+            import duckdb
+
+            self._duckdb = duckdb
+            self._conn = duckdb.connect(":memory:")
+            for name, table_df in tables.items():
+                # types are inferred from the full frame, empty object columns would become INTEGER
+                # and every LOWER(Doctor)/LIKE filter would be rejected, registering doesn't copy data
+                self._conn.register("df_source", table_df)
+                self._conn.execute(f'CREATE TABLE "{name}" AS SELECT * FROM df_source LIMIT 0')
+                self._conn.unregister("df_source")
+        else:
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+            for name, table_df in tables.items():
+                table_df.head(0).to_sql(name, self._conn, index=False, dtype=sqlite_schema(table_df))
+            self._conn.set_authorizer(_sqlite_authorizer)
+
+    @classmethod
+    def from_database(cls, db) -> "SQLValidator":
+        return cls(
+            db.df, db.table_name, getattr(db, "dialect", "sqlite"), getattr(db, "summary_tables", None)
+        )
+
+    def validate(self, sql_query: str) -> tuple[bool, str]:
+        """Check the query.
+
+        Args:
+            sql_query (str): SQL query to check.
+
+        Returns:
+            is query valid and error message (empty if valid)
+        """
+        with self._lock:
+            if self.dialect == "duckdb":
+                ok, message = self._validate_duckdb(sql_query)
+            else:
+                ok, message = self._validate_sqlite(sql_query)
+        if not ok:
+            logger.debug(f"Local SQL validation failed: {message}")
+        return ok, message
+
+    def _validate_sqlite(self, sql_query: str) -> tuple[bool, str]:
+        try:
+            self._conn.execute(f"EXPLAIN {sql_query}")
+        except sqlite3.DatabaseError as e:
+            return False, self._explain_error(str(e))
+        except sqlite3.ProgrammingError as e:  # e.g. multiple statements
+            return False, str(e)
+        except sqlite3.Warning as e:  # older python versions report multiple statements this way
+            return False, str(e)
+        return True, ""
+
+    def _validate_duckdb(self, sql_query: str) -> tuple[bool, str]:
+        try:
+            statements = self._duckdb.extract_statements(sql_query)
+            if len(statements) != 1:
+                return False, "You can only execute one statement at a time."
+            if statements[0].type != self._duckdb.StatementType.SELECT:
+                return False, "Only read-only SELECT queries are allowed."
+            self._conn.execute(f"EXPLAIN {sql_query}")
+        except self._duckdb.Error as e:
+            return False, self._explain_error(str(e))
+        return True, ""
+
+    def _explain_error(self, message: str) -> str:
+        if "not authorized" in message:
+            return "Only read-only SELECT queries are allowed."
+        if "column" in message.lower():
+            return f"{message}. Available columns of table '{self.table_name}': {', '.join(self.columns)}"
+        if "table" in message.lower():
+            return f"{message}. Available tables: {', '.join(self.tables)}"
+        return message
@@ -1,25 +1,543 @@
-from pandasql import sqldf
+import functools
+import heapq
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional, Union
+
 import pandas as pd
-from typing import Union
+from pandasql import sqldf
+
+from ats.logger import get_logger
+
+logger = get_logger(name="db_connector")
+
+# pandas dtype kind -> sqlite column type, everything else is stored as TEXT
+SQLITE_TYPES = {"i": "INTEGER", "u": "INTEGER", "b": "INTEGER", "f": "REAL", "M": "TIMESTAMP"}
+
+
+def _is_newer(path: str, source_path: Optional[str]) -> bool:
+    # without source file it's impossible to tell if dataframe was changed
+    if source_path is None or not os.path.exists(path):
+        return False
+    return os.path.getmtime(path) >= os.path.getmtime(source_path)
+
+
+# typed columnar files, preferred over csv when available
+COLUMNAR_SUFFIXES = (".feather", ".parquet")
+
+# low cardinality columns, stored with dictionary encoding in columnar files
+CATEGORICAL_COLUMNS = [
+    "Gender",
+    "Blood_Type",
+    "Medical_Condition",
+    "Insurance_Provider",
+    "Admission_Type",
+    "Medication",
+    "Test_Results",
+]
+
+
+# point lookups and filters in generated queries, see `indexes_context` in `ats.db_agent.prompts`
+INDEXED_COLUMNS = ["Patient_ID", "Doctor", "Hospital", "Date_of_Admission"]
+# searched with LOWER(...) = '...', indexed by expression, so it's not a full scan
+CASE_FOLDED_COLUMNS = ["Name", "Doctor", "Hospital"]
+
+
+def resolve_data_path(path: str) -> str:
+    """Find the file to load data from.
+
+    For csv path a columnar file with the same name (e.g. healthcare_dataset.feather)
+    is used instead if it exists and is not older than the csv, so csv works as a fallback.
+    """
+    path_ = Path(path)
+    if path_.suffix in COLUMNAR_SUFFIXES:
+        return str(path_)
+    for suffix in COLUMNAR_SUFFIXES:
+        columnar_path = path_.with_suffix(suffix)
+        if columnar_path.exists() and (
+            not path_.exists() or _is_newer(str(columnar_path), str(path_))
+        ):
+            return str(columnar_path)
+    return str(path_)
+
 
-# TODO: replace with sqllite3 
 def load_df(path):
+    path = resolve_data_path(path)
+    if path.endswith(COLUMNAR_SUFFIXES):
+        logger.info(f"Loading columnar data from {path}")
+        return _read_columnar(path)
+
+    logger.info(f"Loading csv data from {path}")
     df = pd.read_csv(path)
     df["Date_of_Admission"] = pd.to_datetime(df["Date_of_Admission"])
     df["Discharge_Date"] = pd.to_datetime(df["Discharge_Date"])
     return df
 
+
+def _read_columnar(path: str) -> pd.DataFrame:
+    # uncompressed feather (written by the processing notebook) is read through a memory map,
+    # so arrow buffers are file pages from the shared page cache, not a private copy of every worker;
+    # parquet has to be decompressed into process memory anyway
+    if path.endswith(".feather"):
+        from pyarrow import feather
+
+        table = feather.read_table(path, memory_map=True)
+    else:
+        from pyarrow import parquet
+
+        table = parquet.read_table(path, memory_map=True)
+    # pandas still gets its own copy, column by column: arrow buffers are released as soon as
+    # a column is converted and columns are not consolidated into 2d blocks, so peak memory isn't doubled
+    # dictionary encoded columns are restored as categoricals
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def save_df(df: pd.DataFrame, path: str):
+    """Save processed dataframe in a typed columnar format (.parquet or .feather).
+
+    `CATEGORICAL_COLUMNS` are dictionary encoded, dates are stored as timestamps,
+    so `load_df` doesn't need to parse anything.
+    """
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+    if str(path).endswith(".feather"):
+        # uncompressed, so it's read without decompression
+        df.to_feather(path, compression="uncompressed")
+    elif str(path).endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        raise ValueError(f"Unsupported columnar format: {path}, use one of {COLUMNAR_SUFFIXES}")
+
+
+def compact_df(df: pd.DataFrame, max_category_ratio: float = 0.5) -> tuple[pd.DataFrame, dict[str, int]]:
+    """Reduce memory footprint of the dataframe.
+
+    String columns with low cardinality become categoricals, integer columns are downcasted
+    (e.g. Age fits into int8). Floats are kept as is, float32 is not precise enough for Billing_Amount.
+
+    Args:
+        df: dataframe to compact
+        max_category_ratio: max share of unique values in a column to convert it to categorical
+
+    Returns:
+        compacted dataframe and memory usage in bytes before and after
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    df = df.copy()
+    for col in df.columns:
+        dtype = df[col].dtype
+        if dtype.kind == "O" and not isinstance(dtype, pd.CategoricalDtype):
+            if df[col].nunique() <= max_category_ratio * len(df):
+                df[col] = df[col].astype("category")
+        elif dtype.kind in "iu":
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+    after = int(df.memory_usage(deep=True).sum())
+
+    logger.info(f"Dataframe compacted from {before / 2**20:.1f} MB to {after / 2**20:.1f} MB")
+    logger.debug(f"Compacted dtypes: {df.dtypes.astype(str).to_dict()}")
+    return df, {"before": before, "after": after}
+
+
+def sqlite_schema(df: pd.DataFrame) -> dict[str, str]:
+    """Map dataframe columns to sqlite column types."""
+    return {col: SQLITE_TYPES.get(dtype.kind, "TEXT") for col, dtype in df.dtypes.items()}
+
+
+class Engine(ABC):
+    """Interface for query engines behind `Database`.
+
+    Engine gets the dataframe once on init and then executes read-only sql queries against it.
+    `dialect` is used to tell the LLM which sql flavour to generate,
+    `indexed` whether filters on `INDEXED_COLUMNS` and LOWER(`CASE_FOLDED_COLUMNS`) are index lookups.
+    """
+
+    dialect = "sqlite"
+    indexed = False
+
+    @abstractmethod
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        table_name: str,
+        path: Optional[str] = None,
+        source_path: Optional[str] = None,
+    ):
+        pass
+
+    @abstractmethod
+    def register(self, table_name: str, df: pd.DataFrame):
+        """Add (or replace) an additional table, e.g. precomputed summary table."""
+
+    @abstractmethod
+    def query(self, query: str) -> pd.DataFrame:
+        pass
+
+    @abstractmethod
+    def close(self):
+        """Release connections, the engine can't be used after that."""
+
+
+class PandasSQLEngine(Engine):
+    """Original approach: dataframe is copied into a new in-memory sqlite on every query."""
+
+    def __init__(self, df, table_name, path=None, source_path=None):
+        # pandasql copies only tables that are used in the query
+        self.tables = {table_name: df}
+
+    def register(self, table_name, df):
+        self.tables[table_name] = df
+
+    def query(self, query: str) -> pd.DataFrame:
+        return sqldf(query, self.tables)
+
+    def close(self):
+        # nothing is kept open, sqlite db is created per query
+        self.tables.clear()
+
+
+class SQLiteEngine(Engine):
+    """Table materialized once into sqlite, queries are executed against it directly.
+
+    Without `path` the database lives in a shared-cache in-memory sqlite,
+    so every thread (i.e. every streamlit session) can open its own connection to the same data.
+    With `path` the database is stored in a file and reused between restarts
+    if it's not older than the source file.
+    """
+
+    indexed = True
+
+    def __init__(self, df, table_name, path=None, source_path=None):
+        self.table_name = table_name
+        if path is None:
+            self.uri = f"file:ats_{id(self)}?mode=memory&cache=shared"
+        else:
+            self.uri = Path(path).resolve().as_uri()
+        self._local = threading.local()
+
+        fresh = path is not None and _is_newer(path, source_path)
+        # this connection is used for writes and also keeps in-memory db alive
+        self._conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+
+        if fresh and self._has_table():
+            logger.info(f"Reusing sqlite database from {path}")
+        else:
+            self._materialize(df)
+
+    def _has_table(self) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.table_name,)
+        ).fetchone() is not None
+
+    def _materialize(self, df: pd.DataFrame):
+        self.register(self.table_name, df)
+        self._create_indexes(df)
+
+    def _create_indexes(self, df: pd.DataFrame):
+        indexes = {f"idx_{col.lower()}": f'"{col}"' for col in INDEXED_COLUMNS if col in df.columns}
+        indexes.update(
+            {f"idx_{col.lower()}_lower": f'LOWER("{col}")' for col in CASE_FOLDED_COLUMNS if col in df.columns}
+        )
+        logger.info(f"Creating sqlite indexes: {', '.join(indexes.values())}")
+        with self._conn:
+            for name, expression in indexes.items():
+                self._conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{self.table_name}" ({expression})')
+            # statistics for the query planner, e.g. to prefer the more selective index
+            self._conn.execute("ANALYZE")
+
+    def register(self, table_name, df):
+        logger.info(f"Materializing {len(df)} rows into sqlite table '{table_name}'")
+        with self._conn:
+            self._conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            df.to_sql(table_name, self._conn, index=False, dtype=sqlite_schema(df))
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.uri, uri=True)
+            # only llm generated queries go through this connection
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+        return conn
+
+    def query(self, query: str) -> pd.DataFrame:
+        return pd.read_sql_query(query, self._connection())
+
+    def close(self):
+        # per-thread read connections of other threads are closed when their threads end,
+        # in-memory db is dropped with the last connection
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        self._conn.close()
+
+
+class DuckDBEngine(Engine):
+    """Columnar engine, aggregations and window functions are vectorized and multi-threaded.
+
+    Dataframe is converted to arrow (or parquet source file is read directly)
+    and materialized into duckdb's native storage,
+    with `path` the database file is reused between restarts like in `SQLiteEngine`.
+    """
+
+    dialect = "duckdb"
+
+    def __init__(self, df, table_name, path=None, source_path=None):
+        import duckdb  # optional dependency, only needed for this engine
+
+        self._duckdb = duckdb
+        self.table_name = table_name
+        self._local = threading.local()
+
+        fresh = path is not None and _is_newer(path, source_path)
+        self._conn = duckdb.connect(path or ":memory:")
+
+        if fresh and self._has_table():
+            logger.info(f"Reusing duckdb database from {path}")
+        else:
+            self._materialize(df, source_path)
+
+    def _has_table(self) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM information_schema.tables WHERE table_name = ?", [self.table_name]
+        ).fetchone() is not None
+
+    def _materialize(self, df: pd.DataFrame, source_path: Optional[str] = None):
+        if source_path is not None and source_path.endswith(".parquet"):
+            logger.info(f"Materializing {source_path} into duckdb table '{self.table_name}'")
+            self._conn.execute(
+                f'CREATE OR REPLACE TABLE "{self.table_name}" AS SELECT * FROM read_parquet(?)',
+                [source_path],
+            )
+        else:
+            self.register(self.table_name, df)
+        self._create_indexes(df)
+
+    def _create_indexes(self, df: pd.DataFrame):
+        # zonemaps already cover range filters (dates), ART indexes help only equality point lookups,
+        # duckdb doesn't use expression indexes for filters, so case-folded columns are not indexed
+        columns = [col for col in INDEXED_COLUMNS if col in df.columns and col != "Date_of_Admission"]
+        logger.info(f"Creating duckdb indexes: {', '.join(columns)}")
+        for col in columns:
+            self._conn.execute(f'CREATE INDEX "idx_{col.lower()}" ON "{self.table_name}" ("{col}")')
+
+    def register(self, table_name, df):
+        import pyarrow as pa
+
+        logger.info(f"Materializing {len(df)} rows into duckdb table '{table_name}'")
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        self._conn.register("arrow_source", arrow_table)
+        self._conn.execute(f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM arrow_source')
+        self._conn.unregister("arrow_source")
+
+    def _cursor(self):
+        # duckdb connections are not thread safe, but cursors sharing the same db are
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._conn.cursor()
+            self._local.cursor = cursor
+        return cursor
+
+    def query(self, query: str) -> pd.DataFrame:
+        # there is no read-only mode for in-memory duckdb, so check statements explicitly
+        for statement in self._duckdb.extract_statements(query):
+            if statement.type != self._duckdb.StatementType.SELECT:
+                raise ValueError(f"Only read-only queries are allowed, got {statement.type.name}")
+        return self._cursor().execute(query).df()
+
+    def close(self):
+        # closes cursors of all threads too
+        self._conn.close()
+
+
+ENGINES: dict[str, type[Engine]] = {
+    "pandasql": PandasSQLEngine,
+    "sqlite": SQLiteEngine,
+    "duckdb": DuckDBEngine,
+}
+
+
+def build_summary_tables(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """Precompute aggregates for the most common questions (per doctor, hospital and condition).
+
+    Returns:
+        table name -> summary table, descriptions for the LLM are in `ats.db_agent.prompts.summary_tables_context`
+    """
+    df = df.assign(
+        length_of_stay=(df["Discharge_Date"] - df["Date_of_Admission"]).dt.days,
+        # categoricals would produce all combinations of categories in groupby
+        **{col: df[col].astype(str) for col in ["Doctor", "Hospital", "Medical_Condition"]},
+    )
+
+    def stats(by: str, **extra) -> pd.DataFrame:
+        return (
+            df.groupby(by)
+            .agg(
+                admission_count=("Patient_ID", "size"),
+                patient_count=("Patient_ID", "nunique"),
+                **extra,
+                total_billing_amount=("Billing_Amount", "sum"),
+                avg_billing_amount=("Billing_Amount", "mean"),
+                avg_length_of_stay_days=("length_of_stay", "mean"),
+                max_length_of_stay_days=("length_of_stay", "max"),
+            )
+            .reset_index()
+        )
+
+    return {
+        "doctor_stats": stats("Doctor", hospital_count=("Hospital", "nunique")),
+        "hospital_stats": stats("Hospital", doctor_count=("Doctor", "nunique")),
+        "condition_stats": stats(
+            "Medical_Condition", doctor_count=("Doctor", "nunique"), hospital_count=("Hospital", "nunique")
+        ),
+    }
+
+
+# free text columns with names, that user refers to in questions
+SEARCHABLE_COLUMNS = ["Name", "Doctor", "Hospital"]
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Casefolded words, punctuation is dropped, e.g. "Moreno Murphy, Griffith and" -> [moreno, murphy, griffith, and]."""
+    return _TOKEN_RE.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+class TokenIndex:
+    """In-process inverted index: token -> distinct values of a column, that contain it.
+
+    Resolves what user typed (e.g. "Moreno Murphy and Griffith") into canonical values
+    ("Moreno Murphy, Griffith and") with a few set intersections instead of a table scan with LIKEs.
+    """
+
+    def __init__(self, df: pd.DataFrame, columns: Optional[list[str]] = None):
+        """
+        Args:
+            df: table to index
+            columns: columns to index, `SEARCHABLE_COLUMNS` by default
+        """
+        self.values: dict[str, list[str]] = {}
+        self._postings: dict[str, dict[str, frozenset[int]]] = {}
+        for col in columns or SEARCHABLE_COLUMNS:
+            if col not in df.columns:
+                continue
+            # ordered by number of words, so the smallest ids are the closest matches
+            values = sorted({str(v) for v in df[col].dropna().unique()}, key=lambda v: (len(tokenize(v)), v))
+            postings = defaultdict(set)
+            for i, value in enumerate(values):
+                for token in tokenize(value):
+                    postings[token].add(i)
+            self.values[col] = values
+            self._postings[col] = {token: frozenset(ids) for token, ids in postings.items()}
+            logger.debug(f"Indexed {len(values)} values, {len(postings)} tokens of column '{col}'")
+
+    def lookup(self, column: str, text: str, limit: int = 10, all_words: bool = False) -> list[str]:
+        """Values of the column, that contain all known words of the text.
+
+        Words that are not in the index at all (e.g. "hospital", "dr") are ignored.
+        Values with the fewest extra words go first, so exact matches are at the top.
+
+        Args:
+            column: indexed column
+            text: name as user wrote it
+            limit: max number of values to return
+            all_words: nothing matches if any word is not in the index, e.g. a typo
+
+        Returns:
+            canonical values, empty if nothing matches
+        """
+        postings = self._postings[column]
+        tokens = set(tokenize(text))
+        if all_words and not tokens <= postings.keys():
+            return []
+        # the rarest tokens first, so intersection shrinks fast
+        known = sorted((postings[t] for t in tokens if t in postings), key=len)
+        if not known:
+            return []
+        ids = set(known[0])
+        for ids_with_token in known[1:]:
+            ids &= ids_with_token
+            if not ids:
+                return []
+        values = self.values[column]
+        return [values[i] for i in heapq.nsmallest(limit, ids)]
+
+
 # simple wrapper, so it can be easily replaced with at least sqlite, but better with a normal DB
 class Database:
-    def __init__(self, df: Union[pd.DataFrame, str]):
+    def __init__(
+        self,
+        df: Union[pd.DataFrame, str],
+        engine: str = "pandasql",
+        db_path: Optional[str] = None,
+        compact: bool = False,
+        materialize: bool = False,
+    ):
+        """
+        Args:
+            df: dataframe or path to the processed csv/parquet/feather file
+            engine: one of `ENGINES`, "pandasql" copies the dataframe into a new sqlite db on every query,
+                "sqlite" and "duckdb" materialize it once and query it directly
+            db_path: optional database file for "sqlite" and "duckdb" engines, in-memory db is used if not set
+            compact: convert low cardinality columns to categoricals and downcast integers,
+                see `compact_df`, memory usage before/after is saved to `memory_report`
+            materialize: build summary tables with precomputed aggregates, see `build_summary_tables`
+        """
+        source_path = resolve_data_path(df) if isinstance(df, str) else None
         if isinstance(df, str):
-            self.df = load_df(df)
+            self.df = load_df(source_path)
         else:
             self.df = df
-        
+
+        self.memory_report = None
+        if compact:
+            self.df, self.memory_report = compact_df(self.df)
+
         # should be used outside of the class to get the table name
         self.table_name = "df"
 
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown database engine: {engine}, available: {list(ENGINES)}")
+        self.engine = engine
+        self._engine = ENGINES[engine](
+            self.df, self.table_name, path=db_path, source_path=source_path
+        )
+        # sql flavour and index hints for prompts
+        self.dialect = self._engine.dialect
+        self.indexed = self._engine.indexed
+
+        # additional tables available for queries, advertised to the LLM
+        self.summary_tables: dict[str, pd.DataFrame] = {}
+        if materialize:
+            self.refresh_summary_tables()
+
+    def refresh_summary_tables(self):
+        """(Re)build summary tables from the main table."""
+        self.summary_tables = build_summary_tables(self.df)
+        for table_name, summary_df in self.summary_tables.items():
+            self._engine.register(table_name, summary_df)
+
+    @functools.cached_property
+    def name_index(self) -> TokenIndex:
+        """Token index over `SEARCHABLE_COLUMNS`, built on first use."""
+        return TokenIndex(self.df)
+
+    def resolve_name(self, column: str, text: str, limit: int = 10, all_words: bool = False) -> list[str]:
+        """Canonical values of Name/Doctor/Hospital column for a user supplied name, see `TokenIndex.lookup`."""
+        return self.name_index.lookup(column, text, limit=limit, all_words=all_words)
+
     def query(self, query):
-        df = self.df
-        return sqldf(query, locals())
+        return self._engine.query(query)
+
+    def close(self):
+        self._engine.close()
@@ -0,0 +1,197 @@
+import asyncio
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from ats.logger import get_logger
+
+logger = get_logger(name="llm_replay")
+
+# "auto" replays recorded prompts and records new ones, so repeated runs get faster and fully offline
+MODES = ("live", "record", "replay", "auto")
+
+
+def prompt_key(messages, model_name: Optional[str] = None) -> str:
+    """Hash of the prompt (message types and contents) and model name."""
+    payload = json.dumps(
+        [model_name, [(getattr(m, "type", type(m).__name__), m.content) for m in messages]], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class JsonlStore:
+    """Recordings in an append-only jsonl file, loaded into memory on init."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._records: dict[str, dict] = {}
+        if self.path.exists():
+            with self.path.open(encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self._records[record["key"]] = record
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._records.get(key)
+
+    def put(self, record: dict):
+        with self._lock:
+            self._records[record["key"]] = record
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def records(self) -> list[dict]:
+        return list(self._records.values())
+
+
+class SQLiteStore:
+    """Recordings in a sqlite table, looked up by key without loading everything into memory."""
+
+    _columns = ["key", "model_name", "prompt", "response", "latency", "created_at"]
+
+    def __init__(self, path: Union[str, Path]):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS recordings ("
+                "key TEXT PRIMARY KEY, model_name TEXT, prompt TEXT, response TEXT, latency REAL, created_at REAL)"
+            )
+
+    def _record(self, row) -> dict:
+        record = dict(zip(self._columns, row))
+        record["response"] = json.loads(record["response"])
+        return record
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self._columns)} FROM recordings WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else self._record(row)
+
+    def put(self, record: dict):
+        values = {**record, "response": json.dumps(record["response"], ensure_ascii=False)}
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO recordings VALUES ({', '.join('?' * len(self._columns))})",
+                [values.get(c) for c in self._columns],
+            )
+
+    def records(self) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self._columns)} FROM recordings ORDER BY created_at"
+            ).fetchall()
+        return [self._record(row) for row in rows]
+
+
+def open_store(path: Union[str, Path]) -> Union[JsonlStore, SQLiteStore]:
+    """sqlite store for .db/.sqlite files, jsonl otherwise."""
+    return SQLiteStore(path) if Path(path).suffix in (".db", ".sqlite") else JsonlStore(path)
+
+
+class ReplayLLM:
+    """Record/replay wrapper around the structured output model (anything with `invoke`/`ainvoke`).
+
+    - "live": calls the model, nothing is stored
+    - "record": calls the model and stores prompt hash -> response (and how long the call took)
+    - "replay": returns recorded responses without calling the model, unknown prompt is an error
+    - "auto": replays recorded prompts, calls the model and records the rest
+
+    In replay, latency of the real model can be simulated, so profiles of everything around llm
+    stay realistic (e.g. for parallel check or streaming) without network.
+    """
+
+    def __init__(
+        self,
+        model=None,
+        path: str = "llm_recordings.jsonl",
+        mode: str = "replay",
+        model_name: Optional[str] = None,
+        latency: Union[None, float, str] = None,
+    ):
+        """
+        Args:
+            model: wrapped model, not needed for replay
+            path: recordings file, sqlite for .db/.sqlite, jsonl otherwise
+            mode: one of `MODES`
+            model_name: part of the key, so recordings of different models don't mix
+            latency: simulated latency of replayed calls: None - no delay, "recorded" - as recorded, number - seconds
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}, available: {MODES}")
+        if mode != "replay" and model is None:
+            raise ValueError(f"Model is required in {mode} mode")
+        if isinstance(latency, str) and latency != "recorded":
+            raise ValueError(f"Unknown latency: {latency}, use None, 'recorded' or seconds")
+        self.model = model
+        self.mode = mode
+        self.model_name = model_name
+        self.latency = latency
+        self.store = open_store(path) if mode != "live" else None
+        self.hits = 0
+        self.misses = 0
+        logger.info(f"LLM replay initialized with mode={mode}, path={path}, latency={latency}")
+
+    def _lookup(self, key: str) -> Optional[dict]:
+        if self.mode not in ("replay", "auto"):
+            return None
+        record = self.store.get(key)
+        if record is None:
+            self.misses += 1
+            if self.mode == "replay":
+                raise KeyError(f"No recorded llm response for prompt {key[:12]}, record it first")
+            return None
+        self.hits += 1
+        return record
+
+    def _delay(self, record: dict) -> float:
+        if self.latency == "recorded":
+            return record.get("latency") or 0.0
+        return self.latency or 0.0
+
+    def _save(self, key: str, messages, response, latency: float):
+        if self.mode in ("record", "auto"):
+            self.store.put(
+                {
+                    "key": key,
+                    "model_name": self.model_name,
+                    # last message, e.g. user query with the task, to find and replay recorded traffic
+                    "prompt": messages[-1].content,
+                    "response": response,
+                    "latency": latency,
+                    "created_at": time.time(),
+                }
+            )
+
+    def invoke(self, messages, config=None):
+        key = prompt_key(messages, self.model_name)
+        record = self._lookup(key)
+        if record is not None:
+            time.sleep(self._delay(record))
+            return copy.deepcopy(record["response"])
+        start = time.perf_counter()
+        response = self.model.invoke(messages, config=config)
+        self._save(key, messages, response, time.perf_counter() - start)
+        return response
+
+    async def ainvoke(self, messages, config=None):
+        key = prompt_key(messages, self.model_name)
+        record = self._lookup(key)
+        if record is not None:
+            await asyncio.sleep(self._delay(record))
+            return copy.deepcopy(record["response"])
+        start = time.perf_counter()
+        response = await self.model.ainvoke(messages, config=config)
+        self._save(key, messages, response, time.perf_counter() - start)
+        return response
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
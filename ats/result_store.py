@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from ats.db_connector import sqlite_schema
+from ats.logger import get_logger
+
+logger = get_logger(name="result_store")
+
+
+class ResultStore:
+    """Server-side storage for full query results.
+
+    LLM gets only a preview and result id, while UI can page through the full result and download it.
+    Every result is a separate sqlite table, results older than `ttl` are evicted on every write.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = 3600):
+        """
+        Args:
+            path: sqlite file to keep results in, in-memory db is used if not set
+            ttl: time to live of a result in seconds, None means forever
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            ":memory:" if path is None else str(Path(path)), check_same_thread=False
+        )
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "id TEXT PRIMARY KEY, created_at REAL, row_count INTEGER, sql_query TEXT, user_query TEXT)"
+            )
+
+    @staticmethod
+    def _table(result_id: str) -> str:
+        return f"result_{result_id}"
+
+    def put(self, df: pd.DataFrame, sql_query: Optional[str] = None, user_query: Optional[str] = None) -> str:
+        """Save result and return its id."""
+        result_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            df.to_sql(self._table(result_id), self._conn, index=False, dtype=sqlite_schema(df))
+            self._conn.execute(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?)",
+                (result_id, time.time(), len(df), sql_query, user_query),
+            )
+        logger.debug(f"Stored result {result_id} with {len(df)} rows")
+        self.evict_expired()
+        return result_id
+
+    def info(self, result_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at, row_count, sql_query, user_query FROM results WHERE id = ?", (result_id,)
+            ).fetchone()
+        if row is None or self._expired(row[0]):
+            return None
+        return dict(zip(["created_at", "row_count", "sql_query", "user_query"], row))
+
+    def get(self, result_id: str, offset: int = 0, limit: Optional[int] = None) -> Optional[pd.DataFrame]:
+        """Get result or its page, None if result doesn't exist or expired."""
+        if self.info(result_id) is None:
+            return None
+        with self._lock:
+            return pd.read_sql_query(
+                f'SELECT * FROM "{self._table(result_id)}" LIMIT ? OFFSET ?',
+                self._conn,
+                params=(-1 if limit is None else limit, offset),
+            )
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def evict_expired(self):
+        if self.ttl is None:
+            return
+        with self._lock, self._conn:
+            expired = self._conn.execute(
+                "SELECT id FROM results WHERE created_at < ?", (time.time() - self.ttl,)
+            ).fetchall()
+            for (result_id,) in expired:
+                self._conn.execute(f'DROP TABLE IF EXISTS "{self._table(result_id)}"')
+                self._conn.execute("DELETE FROM results WHERE id = ?", (result_id,))
+        if expired:
+            logger.debug(f"Evicted {len(expired)} expired results")
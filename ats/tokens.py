@@ -0,0 +1,59 @@
+import functools
+
+from ats.logger import get_logger
+
+logger = get_logger(name="tokens")
+
+# used when model name is unknown to tiktoken, e.g. "smart"
+DEFAULT_ENCODING = "o200k_base"
+# rough average for english text and sql, used when tiktoken is not available
+CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model_name: str):
+    try:
+        import tiktoken  # optional, counts are estimated without it
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:  # e.g. vocabulary can't be downloaded
+        logger.warning(f"tiktoken encoding is not available ({e}), token counts are estimated")
+        return None
+
+
+def count_tokens(text: str, model_name: str = "gpt-4o") -> int:
+    """Number of tokens in the text for the model, exact with tiktoken, estimated by length otherwise."""
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+# usd per 1M tokens: input, output, cached input. Matched by prefix, e.g. "gpt-4o-2024-08-06" -> "gpt-4o"
+# from openai pricing page, update when prices change
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.6, 0.075),
+    "gpt-4o": (2.5, 10.0, 1.25),
+    "gpt-4.1-mini": (0.4, 1.6, 0.1),
+    "gpt-4.1-nano": (0.1, 0.4, 0.025),
+    "gpt-4.1": (2.0, 8.0, 0.5),
+    "o4-mini": (1.1, 4.4, 0.275),
+    "gpt-3.5-turbo": (0.5, 1.5, 0.5),
+}
+
+
+def token_cost(model_name: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0):
+    """Cost of an llm call in usd, None if the model is not in `MODEL_PRICES`."""
+    prefixes = [p for p in MODEL_PRICES if model_name.startswith(p)]
+    if not prefixes:
+        return None
+    input_price, output_price, cached_price = MODEL_PRICES[max(prefixes, key=len)]
+    cached_tokens = min(cached_tokens, input_tokens)
+    return (
+        (input_tokens - cached_tokens) * input_price + cached_tokens * cached_price + output_tokens * output_price
+    ) / 1e6
@@ -0,0 +1,337 @@
+import contextvars
+import functools
+import inspect
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from ats.logger import get_logger
+from ats.tokens import token_cost
+
+logger = get_logger(name="tracing")
+
+# counters that are summed up in `Tracer.summary`
+USAGE_KEYS = ("llm_calls", "input_tokens", "output_tokens", "cached_tokens", "cost_usd")
+
+_CURRENT_SPAN: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_SESSION_ID: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("session_id", default=None)
+
+
+class Span:
+    """One measured stage: name, duration, attributes (rows, cache hits, ...) and llm token usage."""
+
+    def __init__(self, name: str, session_id: Optional[str], parent_id: Optional[str], attributes: dict):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.session_id = session_id
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_time = time.time()
+        self.duration_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def set(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def add(self, key: str, value: float = 1):
+        """Increment a counter attribute, e.g. `span.add("repairs")`."""
+        with self._lock:
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def fail(self, error: str):
+        """Mark the span as failed without an exception, e.g. when an error is returned as a message."""
+        self.error = error
+
+    def callbacks(self) -> list:
+        """LangChain callbacks that add token usage of llm calls to this span, pass them in `config`."""
+        return [TokenUsageCallback(self)]
+
+    def end(self):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "session_id": self.session_id,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan(Span):
+    """Returned by `current_span` outside of any span, so stages can be called directly without tracing."""
+
+    def __init__(self):
+        super().__init__("noop", session_id=None, parent_id=None, attributes={})
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, key: str, value: float = 1):
+        pass
+
+    def fail(self, error: str):
+        pass
+
+    def callbacks(self) -> list:
+        return []
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Adds token usage and cost of llm calls made directly in the span."""
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def on_llm_end(self, response, **kwargs):
+        # callbacks of outer spans are inherited by llm calls inside tools,
+        # those calls are counted by their own span and added to this one when it ends
+        if current_span() is not self.span:
+            return
+        llm_output = response.llm_output or {}
+        usage = llm_output.get("token_usage") or {}
+        input_tokens = usage.get("prompt_tokens")
+        output_tokens = usage.get("completion_tokens")
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        if input_tokens is None:  # providers that report usage only on the message
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    input_tokens = (input_tokens or 0) + metadata.get("input_tokens", 0)
+                    output_tokens = (output_tokens or 0) + metadata.get("output_tokens", 0)
+                    cached_tokens += (metadata.get("input_token_details") or {}).get("cache_read", 0)
+        self.span.add("llm_calls")
+        if input_tokens is None:
+            return
+        self.span.add("input_tokens", input_tokens)
+        self.span.add("output_tokens", output_tokens or 0)
+        self.span.add("cached_tokens", cached_tokens)
+        cost = token_cost(llm_output.get("model_name", ""), input_tokens, output_tokens or 0, cached_tokens)
+        if cost is not None:
+            self.span.add("cost_usd", cost)
+
+
+class JsonlExporter:
+    """Appends finished spans to a local jsonl file, one span per line."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock, self.path.open("a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class OTelExporter:
+    """Mirrors spans to OpenTelemetry, sent to OTLP collector (OTEL_EXPORTER_OTLP_* env vars by default).
+
+    Requires opentelemetry-sdk and opentelemetry-exporter-otlp.
+    """
+
+    def __init__(self, endpoint: Optional[str] = None, service_name: str = "ats"):
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+        self._trace = trace
+        self._tracer = provider.get_tracer("ats")
+        self._spans = {}  # span_id -> otel span, until it's ended
+
+    def on_start(self, span: Span):
+        parent = self._spans.get(span.parent_id)
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        self._spans[span.span_id] = self._tracer.start_span(
+            span.name, context=context, start_time=int(span.start_time * 1e9)
+        )
+
+    def on_end(self, span: Span):
+        otel_span = self._spans.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        for key, value in span.attributes.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(f"ats.{key}", value)
+        if span.session_id is not None:
+            otel_span.set_attribute("session.id", span.session_id)
+        if span.error is not None:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int((span.start_time + span.duration_ms / 1000) * 1e9))
+
+
+class Tracer:
+    """Collects spans of llm and sql stages.
+
+    Spans are nested by context (contextvars), so they work across async tasks and threads
+    that run with a copied context. Finished spans are kept in memory for `summary`
+    and sent to exporters.
+    """
+
+    def __init__(self, exporters: Optional[list] = None, max_spans: int = 10000):
+        """
+        Args:
+            exporters: objects with `on_start(span)` and `on_end(span)`, e.g. `JsonlExporter`
+            max_spans: number of finished spans kept in memory
+        """
+        self.exporters = list(exporters or [])
+        self.spans: deque[dict] = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        parent = _CURRENT_SPAN.get()
+        span = Span(
+            name,
+            session_id=parent.session_id if parent is not None else _SESSION_ID.get(),
+            parent_id=parent.span_id if parent is not None else None,
+            attributes=attributes,
+        )
+        self._export("on_start", span)
+        token = _CURRENT_SPAN.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.fail(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _CURRENT_SPAN.reset(token)
+            span.end()
+            if parent is not None:  # usage of a span includes nested spans
+                for key in USAGE_KEYS:
+                    if key in span.attributes:
+                        parent.add(key, span.attributes[key])
+            with self._lock:
+                self.spans.append(span.to_dict())
+            self._export("on_end", span)
+
+    @contextmanager
+    def session(self, session_id: str):
+        """All root spans inside belong to this session, e.g. a streamlit session."""
+        token = _SESSION_ID.set(session_id)
+        try:
+            yield
+        finally:
+            _SESSION_ID.reset(token)
+
+    def _export(self, method: str, span: Span):
+        for exporter in self.exporters:
+            try:
+                getattr(exporter, method)(span)
+            except Exception as e:  # tracing never breaks the app
+                logger.warning(f"{type(exporter).__name__}.{method} failed: {e}")
+
+    def summary(self, session_id: Optional[str] = None) -> dict[str, dict[str, float]]:
+        """Stats per span name: count, errors, durations, token usage and cost.
+
+        Token usage of a span includes nested spans, "total" is computed over root spans only,
+        so nothing is counted twice there.
+        """
+        with self._lock:
+            spans = [s for s in self.spans if session_id is None or s["session_id"] == session_id]
+        groups = defaultdict(list)
+        for s in spans:
+            groups[s["name"]].append(s)
+            if s["parent_id"] is None:
+                groups["total"].append(s)
+        result = {}
+        for name, group in groups.items():
+            durations = sorted(s["duration_ms"] for s in group)
+            stats = {
+                "count": len(group),
+                "errors": sum(s["error"] is not None for s in group),
+                "mean_ms": sum(durations) / len(durations),
+                "p95_ms": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                "max_ms": durations[-1],
+                "total_ms": sum(durations),
+            }
+            for key in USAGE_KEYS + ("cache_hit",):
+                stats[key] = sum(s["attributes"].get(key, 0) for s in group)
+            result[name] = stats
+        return result
+
+
+_TRACER = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _TRACER
+
+
+def configure_tracing(path: Optional[str] = None, otlp: bool = False, otlp_endpoint: Optional[str] = None) -> Tracer:
+    """Set exporters of the process-wide tracer.
+
+    Args:
+        path: jsonl file to write finished spans to
+        otlp: send spans to OpenTelemetry collector, requires opentelemetry packages
+        otlp_endpoint: collector endpoint, OTEL_EXPORTER_OTLP_* env vars are used if not set
+    """
+    exporters = []
+    if path:
+        exporters.append(JsonlExporter(path))
+    if otlp:
+        try:
+            exporters.append(OTelExporter(endpoint=otlp_endpoint))
+        except ImportError:
+            logger.warning("opentelemetry is not installed, spans are not sent to collector")
+    _TRACER.exporters = exporters
+    return _TRACER
+
+
+def current_span() -> Span:
+    """Innermost active span, a no-op span if nothing is traced, so it's always safe to call `set`/`add`/`fail`."""
+    span = _CURRENT_SPAN.get()
+    return span if span is not None else _NOOP_SPAN
+
+
+def llm_config() -> dict:
+    """`config` for llm `invoke`, so token usage goes to the current span."""
+    callbacks = current_span().callbacks()
+    return {"callbacks": callbacks} if callbacks else {}
+
+
+def traced(name: str):
+    """Run the function (sync or async) inside a span of the process-wide tracer."""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with _TRACER.span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _TRACER.span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
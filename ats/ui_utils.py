@@ -1,25 +1,52 @@
 import json
 
-import pandas as pd
 import streamlit as st
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
 
+from ats.db_agent.encoding import decode_result
 
-def show_tool_message(message):
+
+RESULT_PAGE_SIZE = 100
+
+
+def show_tool_message(message, result_store=None):
     tool_result = json.loads(message.content)
     if not tool_result.get("error"):
         with st.chat_message("tool", avatar="📊"):
             st.write("Raw database results:")
             with st.popover("Click to expand data", use_container_width=True):
-                if tool_result.get("meta", {}).get("user_query"):
-                    st.write(f"Used query: {tool_result["meta"]["user_query"]}")
-                tool_res = json.loads(tool_result["result"])
-                st.dataframe(pd.DataFrame(tool_res))
+                if tool_result.get("user_query"):
+                    st.write(f"Used query: {tool_result["user_query"]}")
+
+                result_id = tool_result.get("result_id")
+                if result_store is not None and result_id and result_store.info(result_id) is not None:
+                    show_stored_result(result_store, result_id, key=message.tool_call_id)
+                else:  # stored result expired or wasn't stored, only preview sent to the model is available
+                    st.dataframe(decode_result(tool_result["result"], tool_result.get("format", "records")))
 
 
-def show_message(message):
+def show_stored_result(result_store, result_id: str, key: str):
+    row_count = result_store.info(result_id)["row_count"]
+    n_pages = max(1, -(-row_count // RESULT_PAGE_SIZE))
+    page = 1
+    if n_pages > 1:
+        page = st.number_input(
+            f"Page (of {n_pages}, {row_count} rows)", min_value=1, max_value=n_pages, value=1, key=f"{key}_page"
+        )
+    st.dataframe(result_store.get(result_id, offset=(page - 1) * RESULT_PAGE_SIZE, limit=RESULT_PAGE_SIZE))
+    st.download_button(
+        "Download full result",
+        # callable, so full result is read only on click
+        data=lambda: result_store.get(result_id).to_csv(index=False),
+        file_name=f"result_{result_id}.csv",
+        mime="text/csv",
+        key=f"{key}_download",
+    )
+
+
+def show_message(message, result_store=None):
     if message.name == "db_tool":
-        show_tool_message(message)
+        show_tool_message(message, result_store)
     elif isinstance(message, HumanMessage):
         st.chat_message("user").markdown(message.content)
     elif isinstance(message, AIMessage):
@@ -27,6 +54,66 @@ def show_message(message):
             st.chat_message("assistant").markdown(message.content)
 
 
+def stream_agent_response(agent, messages: list, result_store=None, config=None) -> list:
+    """Run the chat agent and render its progress as it goes.
+
+    Status shows current stage, table from db_tool is shown as soon as the tool returns
+    and assistant's answer is rendered token by token.
+    `config` is passed to the agent, e.g. callbacks for token usage.
+
+    Returns:
+        new messages produced by the agent
+    """
+    new_messages = []
+    answer, placeholder = "", None
+    status = st.status("Thinking...", expanded=False)
+
+    for mode, chunk in agent.stream(
+        {"messages": messages}, config=config, stream_mode=["messages", "updates"]
+    ):
+        if mode == "messages":
+            token, metadata = chunk
+            # llm calls inside db_tool are streamed too, only chat agent's tokens are shown
+            if metadata.get("langgraph_node") != "agent" or not isinstance(token, AIMessageChunk):
+                continue
+            if isinstance(token.content, str) and token.content:
+                if placeholder is None:
+                    status.update(label="Answering...")
+                    placeholder = st.chat_message("assistant").empty()
+                answer += token.content
+                placeholder.markdown(answer + "▌")
+            continue
+
+        for update in chunk.values():
+            for message in (update or {}).get("messages", []):
+                new_messages.append(message)
+                if isinstance(message, AIMessage) and message.tool_calls:
+                    queries = [call["args"].get("user_query", "") for call in message.tool_calls]
+                    status.update(label=f"Querying database: {'; '.join(queries)}")
+                    # text before tool call is a part of previous message, next one starts from scratch
+                    answer, placeholder = "", None
+                elif isinstance(message, ToolMessage):
+                    show_message(message, result_store)
+                    status.update(label="Thinking...")
+                elif isinstance(message, AIMessage) and placeholder is None:
+                    show_message(message)  # answer wasn't streamed
+
+    if placeholder is not None:
+        placeholder.markdown(answer)
+    status.update(label="Done", state="complete")
+    return new_messages
+
+
+def show_trace_summary(summary: dict):
+    if not summary:
+        st.write("No requests yet.")
+        return
+    rows = []
+    for name, stats in summary.items():
+        rows.append({"stage": name, **{k: round(v, 4 if k == "cost_usd" else 1) for k, v in stats.items()}})
+    st.dataframe(rows, hide_index=True)
+
+
 model_name_map = {
     "smart": "gpt-4o",
     "& smarter": "gpt-4.1",
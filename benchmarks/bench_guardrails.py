@@ -0,0 +1,109 @@
+"""Latency and llm fallback rate of `Guardrails` with and without the local topic classifier.
+
+No network calls: llm is replaced with a stub that counts calls and answers with the expected label.
+Messages here are not used to train the classifier.
+
+    python -m benchmarks.bench_guardrails
+"""
+import argparse
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from ats.chat.guardrails import Guardrails
+from ats.chat.topic_classifier import default_classifier
+
+# (conversation, expected flag), the last message is the one being checked
+CONVERSATIONS = [
+    (["How many patients do I have?", "You have 132 patients.", "and what about last year?"], True),
+    (["Show my admissions in March", "Here they are.", "what about April?"], True),
+    (["List diabetic patients", "Here is the list.", "only the ones older than 50"], True),
+    (["Average bill per hospital", "Here it is.", "which one is the cheapest?"], True),
+    (["Who was admitted yesterday?", "Nobody.", "ok, and this week?"], True),
+    (["How many asthma cases?", "There are 12.", "split by gender please"], True),
+    (["Show my patients", "Here they are.", "can you sort by name?"], True),
+    (["Compare me to colleagues", "Here's the comparison.", "and to the best one?"], True),
+    (["What medications do I prescribe?", "Here they are.", "show percentages"], True),
+    (["Patients of doctor Smith", "Here they are.", "now for doctor Brown"], True),
+    (["How many patients were hospitalized with arthritis?"], True),
+    (["Who are my oldest patients?"], True),
+    (["Which people had inconclusive tests?"], True),
+    (["How many patients do I have?", "You have 132 patients.", "cool, who won the game last night?"], False),
+    (["What is the best way to cook salmon?"], False),
+    (["Write a short story about dragons"], False),
+    (["Tell me who is going to win the elections"], False),
+    (["Recommend a restaurant in Berlin"], False),
+    (["How do I center a div in css?"], False),
+    (["What's the weather in Paris?"], False),
+    (["Translate 'good morning' to Spanish"], False),
+    (["Which car should I buy?"], False),
+    # follow-up phrasing without keywords, decided by the conversation, not by the phrasing
+    (["show me more dog videos"], False),
+    (["Sort them by rating"], False),
+    (["Only the scary ones please"], False),
+    (["Tell me a joke", "Why did the chicken cross the road?", "show me more"], False),
+    (["Recommend a laptop", "Here are three.", "Sort them by battery life"], False),
+    (["Suggest some horror movies", "Here they are.", "only the ones from the 80s"], False),
+]
+
+
+class CountingLLM:
+    """Stands in for the guardrail llm, returns the expected flag and counts calls."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.flag = None
+
+    def invoke(self, messages, config=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        return {"flag": self.flag}
+
+
+def to_messages(conversation: list[str]) -> list:
+    return [HumanMessage(m) if i % 2 == 0 else AIMessage(m) for i, m in enumerate(conversation)]
+
+
+def run(rails: Guardrails, llm: CountingLLM, repeat: int) -> dict:
+    correct, elapsed = 0, 0.0
+    wrong_local = set()  # llm stub is always right, so every mistake is made by keywords or classifier
+    for _ in range(repeat):
+        for conversation, expected in CONVERSATIONS:
+            llm.flag = expected
+            messages = to_messages(conversation)
+            start = time.perf_counter()
+            flag = rails.rail(messages)
+            elapsed += time.perf_counter() - start
+            correct += flag == expected
+            if flag != expected:
+                wrong_local.add(conversation[-1])
+    n = repeat * len(CONVERSATIONS)
+    return {
+        "accuracy": correct / n,
+        "llm_fallback_rate": llm.calls / n,
+        "mean_latency_ms": elapsed / n * 1000,
+        "decided_by": dict(rails.stats),
+        "wrong_local_decisions": sorted(wrong_local),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated llm round-trip, seconds")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    classifier = default_classifier()
+    print(f"classifier training: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for name, clf in [("keywords + llm", None), ("keywords + classifier + llm", classifier)]:
+        llm = CountingLLM(args.llm_latency)
+        rails = Guardrails(fallback_to_llm=True, llm=llm, classifier=clf, classifier_threshold=args.threshold)
+        print(f"{name}: {run(rails, llm, args.repeat)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Guardrail keyword matching: token matcher vs the word alternation regex it replaced.
+
+Reports build time, time per message for short and long messages, how often both agree
+and keyword hits on off-topic messages, that must go to the classifier or the llm instead.
+
+    python -m benchmarks.bench_keyword_matcher
+"""
+import argparse
+import re
+import time
+
+from ats.chat.keyword_matcher import KeywordMatcher
+from ats.chat.utils import off_topic_examples, on_topic_examples, words_for_guardrails
+
+
+# off-topic messages that share a word form or symbol with a keyword ("United" ~ "unit", "a + b" ~ "A+")
+NEGATIVES = [
+    "Who won the United States election?",
+    "what is a + b",
+    "Write a cover letter for a job application",
+    "What's trending on twitter?",
+    "Is C++ faster than C-sharp?",
+    "Solve x - y = 3 for y",
+]
+
+
+def build_regexp(words: list[str]) -> re.Pattern:
+    # as it was in `ats.chat.guardrails`
+    return re.compile(
+        r"(?:^|(?<=\W))(" + "|".join(re.escape(word) for word in words) + r")(?=\W|$)",
+        re.IGNORECASE | re.UNICODE,
+    )
+
+
+def timeit(func, messages: list[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            func(message)
+    return (time.perf_counter() - start) / (repeat * len(messages)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    regexp = build_regexp(words_for_guardrails)
+    print(f"regexp build: {(time.perf_counter() - start) * 1000:.2f} ms")
+    start = time.perf_counter()
+    matcher = KeywordMatcher(words_for_guardrails)
+    print(f"matcher build: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    short = on_topic_examples + off_topic_examples
+    # pasted notes and long questions, keyword (if any) is at the end, so the whole message is scanned
+    long = [" ".join(off_topic_examples[i : i + 15]) + " " + m for i, m in enumerate(short)]
+    for name, messages in [("short", short), ("long", long)]:
+        avg_len = sum(map(len, messages)) / len(messages)
+        regexp_us = timeit(regexp.search, messages, args.repeat)
+        matcher_us = timeit(matcher.search, messages, args.repeat)
+        print(f"{name} messages ({avg_len:.0f} chars): regexp {regexp_us:.1f} us, matcher {matcher_us:.1f} us")
+
+    differ = [m for m in short if (regexp.search(m) is not None) != matcher.search(m)]
+    print(f"agreement on examples: {1 - len(differ) / len(short):.1%}")
+    for message in differ:
+        print(f"  regexp={regexp.search(message) is not None} matcher={matcher.search(message)}: {message}")
+
+    false_positives = [m for m in NEGATIVES if matcher.search(m)]
+    print(f"keyword hits on off-topic negatives: {len(false_positives)}/{len(NEGATIVES)}")
+    for message in false_positives:
+        print(f"  {message}")
+
+
+if __name__ == "__main__":
+    main()
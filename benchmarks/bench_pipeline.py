@@ -0,0 +1,239 @@
+"""End-to-end benchmark of the NLQ -> SQL pipeline (`Guardrails.rail` + `DBAgent.tool`) without network.
+
+LLM is replaced with `ScriptedLLM`, data with a synthetic table of the requested size,
+so only the local parts are measured: engines, validation, caching, result storage and serialization.
+Reports build time and memory of the database, end-to-end latency, throughput
+and mean latency per stage (from `ats.tracing` spans).
+
+Every (rows, engine) config runs in a fresh subprocess, so process RSS belongs to that config only.
+RSS includes sqlite page cache, duckdb buffers and arrow memory, "*_py_heap_mb" (tracemalloc)
+are python allocations only and don't see any of them.
+
+    python -m benchmarks.bench_pipeline --rows 50000 500000 5000000 --engines sqlite duckdb
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("LOG_LEVEL", "warning")  # info logs of every query would dominate the timings
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+
+from ats.chat.guardrails import Guardrails  # noqa: E402
+from ats.chat.topic_classifier import default_classifier  # noqa: E402
+from ats.db_agent.agent import DBAgent  # noqa: E402
+from ats.db_agent.cache import QueryCache  # noqa: E402
+from ats.db_agent.entity_resolution import EntityResolver  # noqa: E402
+from ats.db_agent.sql_validator import SQLValidator  # noqa: E402
+from ats.db_connector import Database  # noqa: E402
+from ats.result_store import ResultStore  # noqa: E402
+from ats.tracing import get_tracer  # noqa: E402
+from benchmarks.fake_llm import ScriptedLLM  # noqa: E402
+from benchmarks.synthetic_data import make_healthcare_df  # noqa: E402
+
+# boolean options passed to worker subprocesses
+SWITCHES = ["cache", "parallel", "materialize", "entity_resolution"]
+
+STAGES = [
+    "guardrails",
+    "db_tool",
+    "check_nlq",
+    "generate_sql_query",
+    "validate_sql",
+    "execute_sql_query",
+]
+
+
+def scenario(df) -> list[tuple[str, str]]:
+    """Questions a doctor would ask and SQL the model is scripted to answer with."""
+    doctor, hospital = df["Doctor"].iloc[0], df["Hospital"].iloc[0]
+    doctor_sql, hospital_sql = doctor.lower().replace("'", "''"), hospital.lower().replace("'", "''")
+    return [
+        (
+            f"How many patients does doctor {doctor} have?",
+            f"SELECT COUNT(DISTINCT Patient_ID) AS patient_count FROM df WHERE LOWER(Doctor) = '{doctor_sql}'",
+        ),
+        (
+            f"List admissions of patients of doctor {doctor}",
+            "SELECT Name, Date_of_Admission, Medical_Condition, Hospital FROM df "
+            f"WHERE LOWER(Doctor) = '{doctor_sql}' ORDER BY Date_of_Admission",
+        ),
+        (
+            f"How many patients does doctor {doctor} have compared to other doctors on average?",
+            "WITH counts AS (SELECT Doctor, COUNT(DISTINCT Patient_ID) AS patient_count FROM df GROUP BY Doctor) "
+            f"SELECT (SELECT patient_count FROM counts WHERE LOWER(Doctor) = '{doctor_sql}') AS my_patient_count, "
+            "AVG(patient_count) AS avg_patient_count FROM counts",
+        ),
+        (
+            "What is the average billing amount per medical condition?",
+            "SELECT Medical_Condition, AVG(Billing_Amount) AS avg_billing_amount FROM df GROUP BY Medical_Condition",
+        ),
+        (
+            "Which 10 hospitals have the most admissions?",
+            "SELECT Hospital, COUNT(*) AS admission_count FROM df GROUP BY Hospital ORDER BY admission_count DESC LIMIT 10",
+        ),
+        (
+            "How many admissions are there by admission type and gender?",
+            "SELECT Admission_Type, Gender, COUNT(*) AS admission_count FROM df GROUP BY Admission_Type, Gender",
+        ),
+        (
+            f"Which patients with blood type O- were treated in {hospital}?",
+            f"SELECT DISTINCT Patient_ID, Name FROM df WHERE Blood_Type = 'O-' AND LOWER(Hospital) = '{hospital_sql}'",
+        ),
+        (
+            "Show emergency admissions with abnormal test results in 2023",
+            "SELECT Patient_ID, Name, Hospital, Date_of_Admission FROM df WHERE Admission_Type = 'Emergency' "
+            "AND Test_Results = 'Abnormal' AND Date_of_Admission >= '2023-01-01' AND Date_of_Admission < '2024-01-01'",
+        ),
+    ]
+
+
+def check_validation(db: Database, questions: list[tuple[str, str]]):
+    """Fail fast if valid SQL (LOWER and LIKE filters) is rejected by the local validator in the engine dialect.
+
+    Otherwise the benchmark would measure regenerations of rejected queries instead of the engine.
+    """
+    validator = SQLValidator.from_database(db)
+    queries = [sql for _, sql in questions]
+    queries.append("SELECT DISTINCT Hospital FROM df WHERE LOWER(Hospital) LIKE '%murphy%' AND Name LIKE 'J%'")
+    for sql in queries:
+        ok, error = validator.validate(sql)
+        if not ok:
+            raise AssertionError(f"{db.dialect} validator rejected valid query: {error}\n{sql}")
+
+
+def rss_mb() -> float:
+    """Current resident set size of the process, linux only, 0 elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return 0.0
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_config(df, engine: str, args) -> dict:
+    questions = scenario(df)
+    llm = ScriptedLLM(rules=[("^" + re.escape(q), sql) for q, sql in questions], latency=args.llm_latency)
+
+    rss_before = rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    db = Database(df, engine=engine, materialize=args.materialize)
+    entity_resolver = EntityResolver(db) if args.entity_resolution else None
+    build_s = time.perf_counter() - start
+    build_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    build_rss = rss_mb() - rss_before
+    check_validation(db, questions)
+
+    agent = DBAgent(
+        model=llm,
+        db=db,
+        table_truncation=200,
+        cache=QueryCache() if args.cache else None,
+        model_name="scripted",
+        parallel=args.parallel,
+        result_store=ResultStore(),
+        entity_resolver=entity_resolver,
+    )
+    rails = Guardrails(fallback_to_llm=True, llm=llm, classifier=default_classifier())
+
+    def ask(question: str) -> dict:
+        rails.rail([HumanMessage(question)])
+        return agent.tool(question)
+
+    tracer = get_tracer()
+    tracer.spans.clear()
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for question, _ in questions:
+            t = time.perf_counter()
+            errors += "error" in ask(question)
+            latencies.append((time.perf_counter() - t) * 1000)
+    total_s = time.perf_counter() - start
+    summary = tracer.summary()
+
+    # separate pass, tracemalloc slows everything down
+    tracemalloc.start()
+    for question, _ in questions:
+        ask(question)
+    query_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "rows": len(df),
+        "engine": engine,
+        "build_s": round(build_s, 3),
+        "data_rss_mb": round(rss_before, 1),
+        "build_rss_mb": round(build_rss, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "build_py_heap_mb": round(build_peak / 2**20, 1),
+        "query_py_heap_mb": round(query_peak / 2**20, 1),
+        "queries": len(latencies),
+        "errors": errors,
+        "mean_ms": round(sum(latencies) / len(latencies), 2),
+        "p50_ms": round(percentile(latencies, 0.5), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "throughput_qps": round(len(latencies) / total_s, 1),
+        "stages_mean_ms": {name: round(summary[name]["mean_ms"], 3) for name in STAGES if name in summary},
+        "llm_calls": dict(llm.calls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[50000])
+    parser.add_argument("--engines", nargs="+", default=["pandasql", "sqlite", "duckdb"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated llm round-trip, seconds")
+    parser.add_argument("--cache", action="store_true", help="use QueryCache, repeats are served from it")
+    parser.add_argument("--parallel", action="store_true", help="run nlq check and sql generation concurrently")
+    parser.add_argument("--materialize", action="store_true", help="build summary tables")
+    parser.add_argument("--entity-resolution", action="store_true")
+    parser.add_argument("--output", help="jsonl file to append results to, e.g. for CI")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # one config, the result is the last line of stdout
+        start = time.perf_counter()
+        df = make_healthcare_df(args.rows[0])
+        generate_s = time.perf_counter() - start
+        print(json.dumps({**run_config(df, args.engines[0], args), "generate_s": round(generate_s, 1)}))
+        return
+
+    flags = ["--repeat", str(args.repeat), "--llm-latency", str(args.llm_latency)]
+    flags += [f"--{name.replace('_', '-')}" for name in SWITCHES if getattr(args, name)]
+    for n_rows in args.rows:
+        for engine in args.engines:
+            command = [sys.executable, "-m", "benchmarks.bench_pipeline", "--worker", "--rows", str(n_rows)]
+            output = subprocess.run(
+                command + ["--engines", engine, *flags], check=True, stdout=subprocess.PIPE, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(json.dumps(result))
+            if args.output:
+                with open(args.output, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Accuracy and latency of NLQ -> SQL per configuration on a golden set of questions.
+
+Every question of `golden_queries.json` has reference SQL, answer of `DBAgent.tool` is correct
+if its full result (from the result store) matches the result of the reference SQL:
+rows in any order (unless "ordered"), columns matched by values (names and order don't matter,
+extra columns are allowed), floats compared after rounding. Questions without reference SQL must be rejected.
+
+Configurations are all combinations of --models, --double-check and --cache.
+LLM responses can be recorded once and replayed offline, replayed calls take as long as recorded
+(--replay-latency), so timings stay comparable with live runs:
+
+    python -m benchmarks.eval_nlq --models gpt-4o gpt-4.1 --double-check 0 1 --llm-mode record
+    python -m benchmarks.eval_nlq --models gpt-4o gpt-4.1 --double-check 0 1 --llm-mode replay
+    python -m benchmarks.eval_nlq --scripted --synthetic-rows 50000  # harness self-check, no llm at all
+"""
+import argparse
+import itertools
+import json
+import math
+import numbers
+import os
+import re
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+os.environ.setdefault("LOG_LEVEL", "warning")
+
+import pandas as pd  # noqa: E402
+
+from ats.db_agent.agent import DBAgent  # noqa: E402
+from ats.db_agent.cache import QueryCache  # noqa: E402
+from ats.db_connector import Database  # noqa: E402
+from ats.llm_replay import ReplayLLM  # noqa: E402
+from ats.result_store import ResultStore  # noqa: E402
+from benchmarks.fake_llm import ScriptedLLM  # noqa: E402
+
+GOLDEN_PATH = Path(__file__).with_name("golden_queries.json")
+
+_MIDNIGHT_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})[ T]00:00:00(?:\.0+)?$")
+
+
+class CountingLLM:
+    """Counts calls to the wrapped model."""
+
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+
+    def invoke(self, messages, config=None):
+        self._count()
+        return self.model.invoke(messages, config=config)
+
+    async def ainvoke(self, messages, config=None):
+        self._count()
+        return await self.model.ainvoke(messages, config=config)
+
+
+def _normalize(value, decimals: int):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, numbers.Number):
+        value = round(float(value), decimals)
+        return 0.0 if value == 0 else value  # -0.0
+    if isinstance(value, pd.Timestamp):
+        value = str(value)
+    value = str(value).strip()
+    # sqlite returns dates as text, duckdb as timestamps
+    return _MIDNIGHT_RE.sub(r"\1", value)
+
+
+def results_match(predicted: pd.DataFrame, reference: pd.DataFrame, ordered: bool = False, decimals: int = 2) -> bool:
+    """Compare query results by values, see module docstring."""
+    if len(predicted) != len(reference):
+        return False
+    reference_columns = [[_normalize(v, decimals) for v in reference.iloc[:, i]] for i in range(reference.shape[1])]
+    predicted_columns = [[_normalize(v, decimals) for v in predicted.iloc[:, i]] for i in range(predicted.shape[1])]
+
+    def column_key(column):
+        return column if ordered else sorted(column, key=repr)
+
+    mapping = []
+    for reference_column in reference_columns:
+        key = column_key(reference_column)
+        for i, predicted_column in enumerate(predicted_columns):
+            if i not in mapping and column_key(predicted_column) == key:
+                mapping.append(i)
+                break
+        else:
+            return False
+    reference_rows = list(zip(*reference_columns))
+    predicted_rows = list(zip(*[predicted_columns[i] for i in mapping]))
+    if ordered:
+        return reference_rows == predicted_rows
+    return Counter(reference_rows) == Counter(predicted_rows)
+
+
+def _most_frequent(series: pd.Series) -> str:
+    counts = series.astype(str).value_counts()
+    return min(counts[counts == counts.max()].index)
+
+
+def load_golden(df: pd.DataFrame, path: Path = GOLDEN_PATH) -> list[dict]:
+    """Golden questions with {doctor}, {hospital} and {patient} filled with the most frequent values of the table."""
+    values = {
+        "doctor": _most_frequent(df["Doctor"]),
+        "hospital": _most_frequent(df["Hospital"]),
+        "patient": _most_frequent(df["Name"]),
+    }
+    sql_values = {k: v.replace("'", "''") for k, v in values.items()}
+    golden = []
+    for item in json.loads(path.read_text()):
+        golden.append(
+            {
+                **item,
+                "question": item["question"].format(**values),
+                "sql": item["sql"].format(**sql_values) if item.get("sql") else None,
+            }
+        )
+    return golden
+
+
+def build_model(model_name: str, args, golden: list[dict]):
+    if args.scripted:
+        return ScriptedLLM(
+            rules=[("^" + re.escape(item["question"]), item["sql"]) for item in golden if item["sql"]],
+            invalid=r"^(delete|drop|update|insert)\b",
+        )
+    model = None
+    if args.llm_mode != "replay":
+        from langchain_openai.chat_models import ChatOpenAI
+
+        model = ChatOpenAI(model=model_name, max_retries=3).with_structured_output(method="json_mode")
+    if args.llm_mode == "live":
+        return model
+    return ReplayLLM(
+        model, path=args.recordings, mode=args.llm_mode, model_name=model_name, latency=replay_latency(args)
+    )
+
+
+def replay_latency(args):
+    # replayed calls take as long as recorded by default, so seconds per question include llm time
+    if args.replay_latency == "none":
+        return None
+    if args.replay_latency == "recorded":
+        return "recorded"
+    return float(args.replay_latency)
+
+
+def evaluate(db: Database, golden: list[dict], model, model_name: str, double_check: bool, cache: bool, args) -> dict:
+    """Run the golden set `args.repeat` times through a fresh `DBAgent` with this configuration."""
+    llm = CountingLLM(model)
+    result_store = ResultStore(ttl=None)
+    agent = DBAgent(
+        model=llm,
+        db=db,
+        double_check=double_check,
+        cache=QueryCache() if cache else None,
+        model_name=model_name,
+        parallel=args.parallel,
+        result_store=result_store,
+    )
+    references = {item["id"]: db.query(item["sql"]) if item["sql"] else None for item in golden}
+
+    answers, wall_time = [], 0.0
+    for _ in range(args.repeat):
+        for item in golden:
+            calls_before = llm.calls
+            start = time.perf_counter()
+            try:
+                response = agent.tool(item["question"])
+            except Exception as e:  # e.g. nothing recorded for this prompt in replay mode
+                response = {"error": f"{type(e).__name__}: {e}"}
+            elapsed = time.perf_counter() - start
+            wall_time += elapsed
+
+            reference = references[item["id"]]
+            sql_query = None
+            if reference is None:
+                correct = "error" in response
+            elif "error" in response:
+                correct = False
+            else:
+                predicted = result_store.get(response["result_id"])
+                sql_query = result_store.info(response["result_id"])["sql_query"]
+                correct = results_match(predicted, reference, ordered=item.get("ordered", False))
+            answers.append(
+                {
+                    "id": item["id"],
+                    "correct": correct,
+                    "llm_calls": llm.calls - calls_before,
+                    "seconds": round(elapsed, 3),
+                    "sql": sql_query,
+                    "error": response.get("error"),
+                }
+            )
+
+    n_correct = sum(a["correct"] for a in answers)
+    return {
+        "model": model_name,
+        "double_check": double_check,
+        "cache": cache,
+        "questions": len(answers),
+        "accuracy": round(n_correct / len(answers), 3),
+        "llm_calls_per_question": round(llm.calls / len(answers), 2),
+        "seconds_per_question": round(wall_time / len(answers), 3),
+        "correct_per_second": round(n_correct / wall_time, 3) if wall_time else math.inf,
+        "failed": sorted({a["id"] for a in answers if not a["correct"]}),
+        "answers": answers,
+    }
+
+
+def load_database(args) -> Database:
+    if args.synthetic_rows:
+        from benchmarks.synthetic_data import make_healthcare_df
+
+        return Database(make_healthcare_df(args.synthetic_rows), engine=args.engine)
+    return Database(args.data, engine=args.engine)
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=os.getenv("DATA_PATH", "data/processed/healthcare_dataset.csv"))
+    parser.add_argument("--synthetic-rows", type=int, help="use synthetic table of this size instead of --data")
+    parser.add_argument("--engine", default="sqlite")
+    parser.add_argument("--models", nargs="+", default=["gpt-4o"])
+    parser.add_argument("--double-check", type=int, nargs="+", default=[0], choices=[0, 1])
+    parser.add_argument("--cache", type=int, nargs="+", default=[0], choices=[0, 1])
+    parser.add_argument("--parallel", action="store_true")
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the golden set, cache is kept between them")
+    parser.add_argument("--llm-mode", default="live", choices=["live", "record", "replay", "auto"])
+    parser.add_argument("--recordings", default="benchmarks/llm_recordings.jsonl")
+    parser.add_argument(
+        "--replay-latency",
+        default="recorded",
+        help='delay of replayed llm calls: "recorded", seconds or "none" (seconds per question without llm time)',
+    )
+    parser.add_argument("--scripted", action="store_true", help="scripted llm answering with reference sql")
+    parser.add_argument("--output", help="jsonl file to append results with per-question answers to")
+    args = parser.parse_args(argv)
+
+    db = load_database(args)
+    golden = load_golden(db.df)
+    models = ["scripted"] if args.scripted else args.models
+
+    for model_name, double_check, cache in itertools.product(models, args.double_check, args.cache):
+        model = build_model(model_name, args, golden)
+        result = evaluate(db, golden, model, model_name, bool(double_check), bool(cache), args)
+        print(json.dumps({k: v for k, v in result.items() if k != "answers"}))
+        if args.output:
+            with open(args.output, "a") as f:
+                f.write(json.dumps(result, default=str) + "\n")
+
+
+if __name__ == "__main__":
+    main()
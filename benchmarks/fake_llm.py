@@ -0,0 +1,81 @@
+"""Deterministic stand-in for the structured output model used by `DBAgent` and `Guardrails`.
+
+Recognizes the task by its prompt and returns canned json, SQL is taken from scripted rules,
+so the whole pipeline runs offline and gives the same result on every run.
+"""
+import asyncio
+import re
+import time
+from collections import Counter
+from typing import Optional
+
+from ats.chat.prompts import guardrail_prompt
+from ats.db_agent.prompts import nlq_check_prompt, nlq_to_sql_prompt
+
+_USER_QUERY_RE = re.compile(r"(?:Original user query|Natural language query|User query):\s*\n(.+?)(?:\n\*\*\*|\n---|$)", re.S)
+
+
+class ScriptedLLM:
+    """Answers `DBAgent` and `Guardrails` prompts without network.
+
+    - nlq check: always valid, unless the query matches `invalid`
+    - sql generation (also regeneration and repair): SQL of the first rule whose pattern matches the user query
+    - sql review: always correct
+    - guardrail: always on-topic
+    """
+
+    def __init__(
+        self,
+        rules: list[tuple[str, str]],
+        default_sql: str = "SELECT COUNT(*) AS record_count FROM df",
+        invalid: Optional[str] = None,
+        latency: float = 0.0,
+    ):
+        """
+        Args:
+            rules: (regex, sql) pairs, regex is searched in the user query case-insensitively
+            default_sql: SQL for queries that match no rule
+            invalid: regex of queries that are rejected by the nlq check
+            latency: simulated round-trip of every call in seconds
+        """
+        self.rules = [(re.compile(pattern, re.I), sql) for pattern, sql in rules]
+        self.default_sql = default_sql
+        self.invalid = re.compile(invalid, re.I) if invalid else None
+        self.latency = latency
+        self.calls = Counter()
+
+    @staticmethod
+    def _user_query(prompt: str) -> str:
+        match = _USER_QUERY_RE.search(prompt)
+        return match.group(1).strip() if match else prompt
+
+    def _respond(self, messages) -> dict:
+        prompt = messages[-1].content
+        if prompt.startswith(guardrail_prompt):
+            self.calls["guardrail"] += 1
+            return {"flag": True}
+        if prompt.startswith(nlq_check_prompt):
+            self.calls["check_nlq"] += 1
+            user_query = self._user_query(prompt)
+            if self.invalid is not None and self.invalid.search(user_query):
+                return {"is_valid": False, "message": "Query is not related to the table."}
+            return {"is_valid": True}
+        if prompt.startswith(nlq_to_sql_prompt):
+            self.calls["generate_sql"] += 1
+            user_query = self._user_query(prompt[len(nlq_to_sql_prompt) :])
+            for pattern, sql in self.rules:
+                if pattern.search(user_query):
+                    return {"query": sql}
+            return {"query": self.default_sql}
+        self.calls["check_sql"] += 1
+        return {"reasoning": "Scripted review.", "is_correct": True}
+
+    def invoke(self, messages, config=None) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def ainvoke(self, messages, config=None) -> dict:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages)
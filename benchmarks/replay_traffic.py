@@ -0,0 +1,94 @@
+"""Replay recorded production traffic against database engines without llm calls.
+
+User queries and SQL generated for them are taken from recordings of `ReplayLLM`
+(LLM_REPLAY_MODE=record or auto in the UI). SQL is served by `ScriptedLLM`,
+so the same queries run through `DBAgent.tool` on every engine and only the database side differs.
+Recorded prompts can't be replayed by hash here: system prompt depends on the engine's sql dialect.
+
+    python -m benchmarks.replay_traffic --recordings llm_recordings.db --engines pandasql sqlite duckdb
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+os.environ.setdefault("LOG_LEVEL", "warning")
+
+from ats.db_agent.agent import DBAgent  # noqa: E402
+from ats.db_agent.prompts import nlq_to_sql_prompt, prompt_regenerate_sql, prompt_repair_sql  # noqa: E402
+from ats.db_connector import Database  # noqa: E402
+from ats.llm_replay import open_store  # noqa: E402
+from ats.result_store import ResultStore  # noqa: E402
+from ats.tracing import get_tracer  # noqa: E402
+from benchmarks.bench_pipeline import STAGES, percentile  # noqa: E402
+from benchmarks.fake_llm import ScriptedLLM  # noqa: E402
+
+_REGENERATION_PREFIXES = tuple(prompt.split("\n", 1)[0] for prompt in (prompt_regenerate_sql, prompt_repair_sql))
+
+
+def recorded_queries(path: str) -> dict[str, str]:
+    """user query -> first SQL generated for it, regenerations and repairs are skipped."""
+    queries = {}
+    for record in open_store(path).records():
+        prompt = record.get("prompt") or ""
+        if not prompt.startswith(nlq_to_sql_prompt):
+            continue
+        # resolved entities are appended after "***"
+        user_query = prompt[len(nlq_to_sql_prompt) :].split("\n***\n", 1)[0].strip()
+        # regenerate and repair prompts go through the same generation prompt
+        if user_query.startswith(_REGENERATION_PREFIXES):
+            continue
+        sql = (record.get("response") or {}).get("query")
+        if sql and user_query not in queries:
+            queries[user_query] = sql
+    return queries
+
+
+def replay(db: Database, queries: dict[str, str], repeat: int) -> dict:
+    # longest first, so a query that is a prefix of another one doesn't take its sql
+    rules = [("^" + re.escape(q), sql) for q, sql in sorted(queries.items(), key=lambda x: -len(x[0]))]
+    agent = DBAgent(model=ScriptedLLM(rules=rules), db=db, model_name="replay", result_store=ResultStore())
+    tracer = get_tracer()
+    tracer.spans.clear()
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for user_query in queries:
+            t = time.perf_counter()
+            errors += "error" in agent.tool(user_query)
+            latencies.append((time.perf_counter() - t) * 1000)
+    total_s = time.perf_counter() - start
+    summary = tracer.summary()
+    return {
+        "queries": len(latencies),
+        "errors": errors,
+        "mean_ms": round(sum(latencies) / len(latencies), 2),
+        "p50_ms": round(percentile(latencies, 0.5), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "throughput_qps": round(len(latencies) / total_s, 1),
+        "stages_mean_ms": {name: round(summary[name]["mean_ms"], 3) for name in STAGES if name in summary},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recordings", default=os.getenv("LLM_REPLAY_PATH", "llm_recordings.db"))
+    parser.add_argument("--data", default=os.getenv("DATA_PATH", "data/processed/healthcare_dataset.csv"))
+    parser.add_argument("--engines", nargs="+", default=["pandasql", "sqlite", "duckdb"])
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    queries = recorded_queries(args.recordings)
+    print(f"{len(queries)} recorded user queries")
+    if not queries:
+        return
+    for engine in args.engines:
+        start = time.perf_counter()
+        db = Database(args.data, engine=engine)
+        result = {"engine": engine, "build_s": round(time.perf_counter() - start, 3), **replay(db, queries, args.repeat)}
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Synthetic healthcare table with the same schema and similar cardinalities as the processed kaggle dataset.
+
+Generated with numpy in one pass, 5M rows take a few seconds.
+"""
+import numpy as np
+import pandas as pd
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+    "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+    "Christopher", "Nancy", "Daniel", "Lisa", "Matthew", "Betty", "Anthony", "Margaret", "Mark", "Sandra",
+    "Donald", "Ashley", "Steven", "Kimberly", "Paul", "Emily", "Andrew", "Donna", "Joshua", "Michelle",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson",
+    "Walker", "Young", "Allen", "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores",
+    "Green", "Adams", "Nelson", "Baker", "Hall", "Rivera", "Campbell", "Mitchell", "Carter", "Roberts",
+]
+# like in the original data, including 'broken' ones as "Moreno Murphy, Griffith and"
+HOSPITAL_PATTERNS = [
+    "{a} and {b}", "{a}, {b} and {c}", "{a} Inc", "{a} Group", "{a} Ltd", "{a} PLC", "{a} LLC", "{a}, {b} and",
+]
+
+CATEGORIES = {
+    "Gender": ["Male", "Female"],
+    "Blood_Type": ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"],
+    "Medical_Condition": ["Arthritis", "Asthma", "Cancer", "Diabetes", "Hypertension", "Obesity"],
+    "Insurance_Provider": ["Aetna", "Blue Cross", "Cigna", "Medicare", "UnitedHealthcare"],
+    "Admission_Type": ["Elective", "Emergency", "Urgent"],
+    "Medication": ["Aspirin", "Ibuprofen", "Lipitor", "Paracetamol", "Penicillin"],
+    "Test_Results": ["Abnormal", "Inconclusive", "Normal"],
+}
+
+
+def _people(rng: np.random.Generator, n: int) -> np.ndarray:
+    first = rng.choice(FIRST_NAMES, n)
+    last = rng.choice(LAST_NAMES, n)
+    # suffix keeps names distinct at millions of rows, like the real data has many unique names
+    suffix = rng.integers(0, max(1, n // len(FIRST_NAMES) // len(LAST_NAMES) + 1), n)
+    names = np.char.add(np.char.add(first, " "), last)
+    return np.char.add(names, np.where(suffix > 0, np.char.add(" ", suffix.astype(str)), ""))
+
+
+def _hospitals(rng: np.random.Generator, n: int) -> np.ndarray:
+    patterns = rng.choice(HOSPITAL_PATTERNS, n)
+    names = rng.choice(LAST_NAMES, (n, 3))
+    return np.array([p.format(a=a, b=b, c=c) for p, (a, b, c) in zip(patterns, names)])
+
+
+def make_healthcare_df(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Table with `n_rows` admissions.
+
+    Roughly 1.2 admissions per patient, 1 doctor per 5 admissions and 1 hospital per 10 admissions,
+    as in the original dataset, so name lookups and group-bys have realistic cardinalities.
+    """
+    rng = np.random.default_rng(seed)
+    n_patients = max(1, int(n_rows / 1.2))
+    patient_ids = rng.integers(0, n_patients, n_rows)
+    patient_names = _people(rng, n_patients)
+    years_of_birth = rng.integers(1930, 2010, n_patients)
+    genders = rng.choice(CATEGORIES["Gender"], n_patients)
+    blood_types = rng.choice(CATEGORIES["Blood_Type"], n_patients)
+
+    doctors = np.unique(_people(rng, max(1, n_rows // 5)))
+    hospitals = np.unique(_hospitals(rng, max(1, n_rows // 10)))
+
+    admission = np.datetime64("2019-05-08") + rng.integers(0, 5 * 365, n_rows).astype("timedelta64[D]")
+    stay = rng.integers(1, 31, n_rows).astype("timedelta64[D]")
+    admission_years = admission.astype("datetime64[Y]").astype(int) + 1970
+
+    return pd.DataFrame(
+        {
+            "Patient_ID": patient_ids,
+            "Name": patient_names[patient_ids],
+            "Year_of_Birth": years_of_birth[patient_ids],
+            "Age": admission_years - years_of_birth[patient_ids],
+            "Gender": genders[patient_ids],
+            "Blood_Type": blood_types[patient_ids],
+            "Medical_Condition": rng.choice(CATEGORIES["Medical_Condition"], n_rows),
+            "Date_of_Admission": pd.to_datetime(admission),
+            "Doctor": doctors[rng.integers(0, len(doctors), n_rows)],
+            "Hospital": hospitals[rng.integers(0, len(hospitals), n_rows)],
+            "Insurance_Provider": rng.choice(CATEGORIES["Insurance_Provider"], n_rows),
+            "Billing_Amount": np.round(rng.uniform(-2000, 52000, n_rows), 2),
+            "Room_Number": rng.integers(101, 501, n_rows),
+            "Admission_Type": rng.choice(CATEGORIES["Admission_Type"], n_rows),
+            "Discharge_Date": pd.to_datetime(admission + stay),
+            "Medication": rng.choice(CATEGORIES["Medication"], n_rows),
+            "Test_Results": rng.choice(CATEGORIES["Test_Results"], n_rows),
+        }
+    )
@@ -1,36 +1,113 @@
 import os
+import uuid
 
 import streamlit as st
 from langgraph.prebuilt import create_react_agent
 
+from ats.chat.history import HistoryManager
 from ats.chat.prompts import chat_system_prompt
 from ats.db_agent.agent import DBAgent
+from ats.db_agent.cache import QueryCache
+from ats.db_agent.entity_resolution import EntityResolver
 from ats.db_connector import Database
+from ats.llm_replay import ReplayLLM
+from ats.result_store import ResultStore
+from ats.tracing import configure_tracing, llm_config
 from ats.chat.guardrails import Guardrails
+from ats.chat.topic_classifier import default_classifier
 
 from langchain_openai.chat_models import ChatOpenAI
 from langchain.tools import tool
 from langchain_core.messages import HumanMessage
 
-from ats.ui_utils import show_message, show_tool_message, model_name_map
+from ats.ui_utils import show_message, show_tool_message, show_trace_summary, stream_agent_response, model_name_map
 
 # PARAMS:
 DATA_PATH = os.getenv("DATA_PATH", "data/processed/healthcare_dataset.csv")
 LLM_RETRIES = os.getenv("LLM_RETRIES", 3)
 API_KEY = os.getenv("OPENAI_API_KEY")
 CHAT_MODEL_NAME = os.getenv("CHAT_MODEL_NAME", "gpt-4o")
+DB_ENGINE = os.getenv("DB_ENGINE", "pandasql")
+DB_PATH = os.getenv("DB_PATH")
+DB_COMPACT = os.getenv("DB_COMPACT", "").lower() == "true"
+DB_MATERIALIZE = os.getenv("DB_MATERIALIZE", "").lower() == "true"
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))  # 0 to disable
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 3600))
+QUERY_CACHE_RESULTS = os.getenv("QUERY_CACHE_RESULTS", "").lower() == "true"
+PARALLEL_CHECK = os.getenv("PARALLEL_CHECK", "true").lower() == "true"
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH")
+RESULT_TTL = float(os.getenv("RESULT_TTL", 3600))
+RESULT_FORMAT = os.getenv("RESULT_FORMAT", "columns")
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+ENTITY_RESOLUTION = os.getenv("ENTITY_RESOLUTION", "true").lower() == "true"
+COMPACT_SCHEMA = os.getenv("COMPACT_SCHEMA", "").lower() == "true"
+GUARDRAILS_CLASSIFIER = os.getenv("GUARDRAILS_CLASSIFIER", "true").lower() == "true"
+GUARDRAILS_THRESHOLD = float(os.getenv("GUARDRAILS_THRESHOLD", 0.8))
+HISTORY_TURNS = int(os.getenv("HISTORY_TURNS", 3))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", 8000))  # 0 for no limit
+HISTORY_SUMMARY = os.getenv("HISTORY_SUMMARY", "").lower() == "true"
+TRACE_PATH = os.getenv("TRACE_PATH")
+TRACE_OTLP = os.getenv("TRACE_OTLP", "").lower() == "true"
+LLM_REPLAY_MODE = os.getenv("LLM_REPLAY_MODE", "live")  # live, record, replay or auto
+LLM_REPLAY_PATH = os.getenv("LLM_REPLAY_PATH", "llm_recordings.db")
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY") or None  # "recorded" or seconds, no delay if not set
 
 st.title("Healthcare search agent")
 
 
+# spans of every llm and sql stage, kept in memory for the stats view and optionally exported
+@st.cache_resource
+def get_tracer():
+    return configure_tracing(path=TRACE_PATH, otlp=TRACE_OTLP)
+
+
+tracer = get_tracer()
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+
 # LOAD DATA
-@st.cache_data
+# cache_resource, not cache_data: db holds connections and shouldn't be copied on every rerun
+@st.cache_resource
 def get_db():
-    return Database(DATA_PATH)
+    return Database(
+        DATA_PATH, engine=DB_ENGINE, db_path=DB_PATH, compact=DB_COMPACT, materialize=DB_MATERIALIZE
+    )
 
 
 db = get_db()
 
+
+# shared between all sessions, so repeated questions skip llm calls
+@st.cache_resource
+def get_query_cache():
+    if QUERY_CACHE_SIZE <= 0:
+        return None
+    return QueryCache(max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL, cache_results=QUERY_CACHE_RESULTS)
+
+
+query_cache = get_query_cache()
+
+
+# full query results, so users can see and download them without feeding everything to llm
+@st.cache_resource
+def get_result_store():
+    return ResultStore(path=RESULT_STORE_PATH, ttl=RESULT_TTL)
+
+
+result_store = get_result_store()
+
+
+# distinct values of name columns, built once and shared by all db agents
+@st.cache_resource
+def get_entity_resolver():
+    if not ENTITY_RESOLUTION:
+        return None
+    return EntityResolver(db)
+
+
+entity_resolver = get_entity_resolver()
+
 # SIDEBAR WITH KNOBS
 with st.sidebar:
     st.write("## Parameters:")
@@ -42,16 +119,13 @@ with st.sidebar:
         "LLM", options=["smart", "& smarter", "& even smarter"]
     )
 
-    # it would be nice to have a database to store temp tables for users instead of feeding it to llm
-    # so they could download it as a file or check on ui if it's too big for llm
-    # but I spent to much time on agents debug, so it's TODO for the next sprint
-    # also I tried to put output tables into session_state, but that didn't work for some reason, so I gave up
+    # only this part of the table goes to llm, full result is kept in the result store
     table_truncation = st.slider(
         "Maximum size of output table",
         min_value=1,
         max_value=300,
         value=200,
-        help="Too big tables won't fit into models context, but they can be truncated to the threshold",
+        help="Too big tables won't fit into models context, so only this number of rows is sent to the model. Full table is available in results view.",
     )
 
     double_check = st.checkbox(
@@ -61,52 +135,114 @@ with st.sidebar:
 
 
 # SETUP MODEL FOR DB_TOOL AND RAILS
+# everything below is built once per process and config and shared between reruns and sessions,
+# so there is no object construction on every interaction and http connections of llm clients are reused
+
+
+@st.cache_resource
+def get_db_model(model_name: str):
+    model = None
+    if LLM_REPLAY_MODE != "replay":  # no api calls in replay mode
+        model = ChatOpenAI(
+            name=model_name,
+            api_key=API_KEY,
+            max_retries=LLM_RETRIES,
+            # yes, it's better to use pydantic models, but it's overkill for poc
+            # especially when you need to experiment a lot, it add additional unnecessary complexety to handle
+        ).with_structured_output(method="json_mode")
+    if LLM_REPLAY_MODE == "live":
+        return model
+    # db agent and guardrails calls are recorded or served from recordings
+    latency = LLM_REPLAY_LATENCY
+    if latency is not None and latency != "recorded":
+        latency = float(latency)
+    return ReplayLLM(model, path=LLM_REPLAY_PATH, mode=LLM_REPLAY_MODE, model_name=model_name, latency=latency)
+
+
+@st.cache_resource
+def get_rails(model_name: str):
+    return Guardrails(
+        fallback_to_llm=True,
+        llm=get_db_model(model_name),
+        classifier=default_classifier() if GUARDRAILS_CLASSIFIER else None,
+        classifier_threshold=GUARDRAILS_THRESHOLD,
+    )
 
-model = ChatOpenAI(
-    name=model_name_map[db_agent_model_name],
-    api_key=API_KEY,
-    max_retries=LLM_RETRIES,
-    # yes, it's better to use pydantic models, but it's overkill for poc
-    # especially when you need to experiment a lot, it add additional unnecessary complexety to handle
-).with_structured_output(method="json_mode")
-rails = Guardrails(fallback_to_llm=True, llm=model)
 
-# SETUP TOOLS FOR CHAT AGENT
+@st.cache_resource
+def get_db_agent(model_name: str, double_check: bool, table_truncation: int):
+    return DBAgent(
+        model=get_db_model(model_name),
+        db=db,
+        double_check=double_check,
+        table_truncation=table_truncation,
+        cache=query_cache,
+        model_name=model_name,
+        parallel=PARALLEL_CHECK,
+        result_store=result_store,
+        result_format=RESULT_FORMAT,
+        entity_resolver=entity_resolver,
+        compact_schema=COMPACT_SCHEMA,
+    )
+
+
+rails = get_rails(model_name_map[db_agent_model_name])
+
+# SETUP CHAT AGENT
 
 
-# I didn't manage to make this decorator work with class method, so here is this stupid workaround
-@tool
-def db_tool(user_query: str):
-    """Executes user's natural language query on healthcare database.
-    Transforms the natural language query into a SQL query using a language model and executes it against the healthcare database.
+@st.cache_resource
+def get_chat_model():
+    return ChatOpenAI(name=CHAT_MODEL_NAME, api_key=API_KEY, max_retries=LLM_RETRIES)
 
-    Args:
-        user_query (str): The natural language query from the user.
 
-    Return:
-        Results from database or string with error
-    """
-    db_agent = DBAgent(
-        model=model, db=db, double_check=double_check, table_truncation=table_truncation
+# prompt depends on user name, so it's one graph per user and config
+@st.cache_resource(max_entries=256)
+def get_agent(user_name: str, model_name: str, double_check: bool, table_truncation: int):
+    db_agent = get_db_agent(model_name, double_check, table_truncation)
+
+    # I didn't manage to make this decorator work with class method, so here is this stupid workaround
+    @tool
+    def db_tool(user_query: str):
+        """Executes user's natural language query on healthcare database.
+        Transforms the natural language query into a SQL query using a language model and executes it against the healthcare database.
+
+        Args:
+            user_query (str): The natural language query from the user.
+
+        Return:
+            Results from database or string with error
+        """
+        try:
+            result = db_agent.tool(user_query=user_query)
+        except Exception as e:
+            return f"Tool failed: {str(e)}"
+        return result
+
+    return create_react_agent(
+        get_chat_model(),
+        [db_tool],
+        prompt=chat_system_prompt.format(user_name=user_name),
+        debug=os.getenv("LOG_LEVEL", "").lower() == "debug",
     )
-    try:
-        result = db_agent.tool(user_query=user_query)
-    except Exception as e:
-        return f"Tool failed: {str(e)}"
-    return result
 
 
-tools = [db_tool]
+agent = get_agent(username, model_name_map[db_agent_model_name], double_check, table_truncation)
+
+
+# full conversation is shown in the ui, only its window goes to the chat model,
+# so prompt doesn't grow with every message of a long session
+@st.cache_resource
+def get_history_manager():
+    return HistoryManager(
+        keep_turns=HISTORY_TURNS,
+        max_tokens=HISTORY_MAX_TOKENS or None,
+        summary_llm=get_chat_model() if HISTORY_SUMMARY else None,
+        model_name=CHAT_MODEL_NAME,
+    )
 
-# SETUP CHAT AGENT
 
-model_agent = ChatOpenAI(name=CHAT_MODEL_NAME, api_key=API_KEY, max_retries=LLM_RETRIES)
-agent = create_react_agent(
-    model_agent,
-    tools,
-    prompt=chat_system_prompt.format(user_name=username),
-    debug=os.getenv("LOG_LEVEL", "").lower() == "debug",
-)
+history = get_history_manager()
 
 # START OF THE PAGE
 
@@ -117,7 +253,7 @@ if username is not None:
 
     # show messages in the chat
     for message in st.session_state.messages:
-        show_message(message)
+        show_message(message, result_store)
 
     # main processing
     if prompt := st.chat_input("Type your message here"):
@@ -125,7 +261,8 @@ if username is not None:
         to_check_with_rails = st.session_state.messages + [prompt]
 
         try:
-            rails_check = rails.rail(to_check_with_rails)
+            with st.spinner("Checking the message..."), tracer.session(st.session_state.session_id):
+                rails_check = rails.rail(to_check_with_rails)
         except Exception:
             raise
             st.info("Sorry, something went wrong, please try again later.")
@@ -134,16 +271,26 @@ if username is not None:
             st.session_state.messages.append(prompt)
             show_message(prompt)
             try:
-                # returns full convesation
-                response = agent.invoke({"messages": st.session_state.messages})
-
-                st.session_state.messages = response["messages"]
-
-                # show tool message to increase transparency
-                # so users could detect hallucinations
-                if response["messages"][-2].name == "db_tool":
-                    show_tool_message(response["messages"][-2])  # show resulting table
-                show_message(response["messages"][-1])  # show llm response
+                with tracer.session(st.session_state.session_id), tracer.span("chat_agent") as span:
+                    agent_messages = history.window(st.session_state.messages)
+                    span.set(history_messages=len(agent_messages))
+                    if STREAM_RESPONSES:
+                        # tool messages are shown as soon as they are ready to increase transparency
+                        # so users could detect hallucinations
+                        st.session_state.messages += stream_agent_response(
+                            agent, agent_messages, result_store, config=llm_config()
+                        )
+                    else:
+                        # returns full convesation of what was sent and new messages
+                        response = agent.invoke({"messages": agent_messages}, config=llm_config())
+
+                        st.session_state.messages += response["messages"][len(agent_messages) :]
+
+                        # show tool message to increase transparency
+                        # so users could detect hallucinations
+                        if response["messages"][-2].name == "db_tool":
+                            show_tool_message(response["messages"][-2], result_store)  # show resulting table
+                        show_message(response["messages"][-1])  # show llm response
             except Exception:
                 st.info("Sorry, something went wrong, please try again later.")
                 raise
@@ -152,3 +299,8 @@ if username is not None:
             st.info(
                 "System is focused only on question answering for healthcare! Please try again with another message."
             )
+
+# at the end, so it includes the latest message
+with st.sidebar:
+    with st.expander("Performance of this session"):
+        show_trace_summary(tracer.summary(st.session_state.session_id))